@@ -5,6 +5,9 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime
 
+from Metrics import timed
+from Sketches import VisitSketches
+
 # =========================================
 #  Estilo global: 'Old Money' vintage pastel palette
 # =========================================
@@ -34,10 +37,58 @@ BASE_LAYOUT = dict(
     margin=dict(t=100, b=60, l=60, r=40)
 )
 
+# =========================================
+#  Preprocesamiento común de visitas
+# =========================================
+def preprocess_visits(df):
+    """Agrega las columnas derivadas (fechas, tiempo total, día) que usan las gráficas."""
+    df['FechaDT'] = pd.to_datetime(df['Fecha'], format='%Y%m%d', errors='coerce')
+    df['InicioEsperaDT'] = pd.to_datetime(df['Hora inicio de espera limpia'], errors='coerce')
+    df['InicioAtencionDT'] = pd.to_datetime(df['Hora inicio de atencion'], errors='coerce')
+
+    df.dropna(subset=['InicioEsperaDT', 'InicioAtencionDT'], inplace=True)
+
+    df['TotalTiempo'] = df['Minutos de espera'] + df['Minutos de atencion']
+    df['DiaSemana'] = df['InicioEsperaDT'].dt.day_name()
+    return df
+
+
+def load_dashboard_aggregates(loader, table, category_col='Sucursal'):
+    """
+    Agrega en el servidor lo que necesitan las vistas de conteos y promedios,
+    en el formato que aceptan con pre_aggregated=True:
+      - hourly:     [category_col, Fecha, Hora, Count]  (heatmap y curva horaria)
+      - daily:      [FechaDT, category_col, Count]      (área apilada)
+      - avg_total:  [category_col, TotalTiempo]          (barras de tiempo total)
+    """
+    start_col = 'Hora inicio de espera limpia'
+    # Mismo filtro que el dropna de preprocess_visits
+    not_null = [start_col, 'Hora inicio de atencion']
+    return {
+        "hourly": loader.aggregate(
+            table,
+            [category_col, ("date", start_col, "Fecha"), ("hour", start_col, "Hora")],
+            {"Count": ("count", "*")}, not_null=not_null),
+        "daily": loader.aggregate(
+            table, [("date", "Fecha", "FechaDT"), category_col],
+            {"Count": ("count", "*")}, not_null=not_null),
+        "avg_total": loader.aggregate(
+            table, [category_col],
+            {"TotalTiempo": ("avg", ("Minutos de espera", "Minutos de atencion"))},
+            not_null=not_null),
+    }
+
+
 # =========================================
 #  Panel combinado de los 4 primeros gráficos
 # =========================================
-def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Combinados Extendidos"):
+@timed()
+def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Combinados Extendidos",
+                         quantiles=None):
+    """
+    quantiles: resumen por categoría de TotalTiempo (Sketches.VisitSketches.quantiles);
+    si no se da, se calcula de df.
+    """
     # Verificación de columnas necesarias
     required_cols = ['PacienteFechaNacimiento', 'Fecha', 'Minutos de espera',
                      'Minutos de atencion', 'TotalTiempo', 'Cumple_20min']
@@ -45,10 +96,11 @@ def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Co
         if col not in df.columns:
             raise ValueError(f"Falta la columna requerida: {col}")
 
-    # Limpieza y formatos
-    df['PacienteFechaNacimiento'] = pd.to_datetime(df['PacienteFechaNacimiento'], errors='coerce')
-    df['FechaDT'] = pd.to_datetime(df['Fecha'], format='%Y%m%d', errors='coerce')
-    df = df.dropna(subset=['PacienteFechaNacimiento', 'FechaDT'])
+    # Limpieza y formatos (sobre una copia filtrada: df puede ser el frame compartido en caché)
+    nacimiento = pd.to_datetime(df['PacienteFechaNacimiento'], errors='coerce')
+    fecha_dt = pd.to_datetime(df['Fecha'], format='%Y%m%d', errors='coerce')
+    valid = nacimiento.notna() & fecha_dt.notna()
+    df = df.loc[valid].assign(PacienteFechaNacimiento=nacimiento[valid], FechaDT=fecha_dt[valid])
 
     # Cálculo de edad
     df['Edad'] = df['PacienteFechaNacimiento'].apply(lambda x: datetime.now().year - x.year)
@@ -81,6 +133,10 @@ def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Co
         ]
     )
 
+    if quantiles is None:
+        quantiles = VisitSketches(['TotalTiempo']).update(df).quantiles('TotalTiempo', by=category_col)
+    box_stats = quantiles.set_index(category_col)
+
     # Procesar cada categoría
     cats = df[category_col].dropna().unique()
     for i, cat in enumerate(cats):
@@ -88,15 +144,22 @@ def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Co
         color = PALETTE[i % len(PALETTE)]
         sub = df[df[category_col] == cat].copy()
 
-        # === Panel 1: Violin plot del tiempo total ===
-        fig.add_trace(go.Violin(
-            y=sub['TotalTiempo'], name=cat,
-            box_visible=True, meanline_visible=True,
-            line_color=color, fillcolor=color,
-            opacity=0.6, points='all', jitter=0.2,
-            marker=dict(size=3, opacity=0.5),
-            visible=visible
-        ), row=1, col=1)
+        # === Panel 1: Caja del tiempo total a partir de cuantiles ===
+        # Sin tiempos válidos la categoría no tiene cuantiles: caja vacía para que
+        # cada categoría conserve el mismo número de trazas (menú desplegable)
+        if cat in box_stats.index and box_stats.at[cat, 'Conteo'] > 0:
+            q = box_stats.loc[cat]
+            iqr = q['q0.75'] - q['q0.25']
+            fig.add_trace(go.Box(
+                x=[cat], q1=[q['q0.25']], median=[q['q0.5']], q3=[q['q0.75']],
+                lowerfence=[max(q['q0.25'] - 1.5 * iqr, q['Min'])],
+                upperfence=[min(q['q0.75'] + 1.5 * iqr, q['Max'])],
+                mean=[q['Media']], name=cat,
+                line_color=color, fillcolor=color, opacity=0.6,
+                visible=visible
+            ), row=1, col=1)
+        else:
+            fig.add_trace(go.Box(x=[], name=cat, line_color=color, visible=visible), row=1, col=1)
 
         # === Panel 2: Scatter + tendencia ===
         fig.add_trace(go.Scatter(
@@ -113,7 +176,9 @@ def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Co
             trend.visible = visible
             fig.add_trace(trend, row=1, col=2)
         except Exception:
-            pass  # Si no hay suficientes datos para OLS
+            # Si no hay suficientes datos para OLS: traza vacía en su lugar
+            fig.add_trace(go.Scatter(x=[], y=[], name=f"{cat} tendencia", visible=visible),
+                          row=1, col=2)
 
         # === Panel 3: Serie temporal de atención ===
         daily = sub.groupby('FechaDT')['Minutos de atencion'].mean().reset_index()
@@ -211,7 +276,20 @@ def plot_combined_panels(df, metrics, category_col='Sucursal', title="Paneles Co
 #  Funciones adicionales de visualización
 # =========================================
 
-def plot_histogram_density(df, metric, title, bins=40):
+def _prebinned_bars(hist, color):
+    """Barras contiguas a partir de un histograma [Desde, Hasta, Conteo, ...]."""
+    return dict(x=(hist['Desde'] + hist['Hasta']) / 2, width=hist['Hasta'] - hist['Desde'],
+                marker_color=color, marker_line_color=FONT_COLOR, marker_line_width=1)
+
+
+@timed()
+def plot_histogram_density(df, metric, title, bins=40, pre_aggregated=False):
+    """Con pre_aggregated=True, df es Sketches.VisitSketches.histogram(metric)."""
+    if pre_aggregated:
+        fig = go.Figure(go.Bar(y=df['Densidad'], name=metric, **_prebinned_bars(df, PALETTE[3])))
+        fig.update_layout(BASE_LAYOUT, title=title, bargap=0,
+                          xaxis_title=metric, yaxis_title='density')
+        return fig
     fig = px.histogram(
         df, x=metric, nbins=bins,
         histnorm='density', marginal='rug',
@@ -222,7 +300,21 @@ def plot_histogram_density(df, metric, title, bins=40):
     fig.update_layout(BASE_LAYOUT)
     return fig
 
-def plot_facet_histogram(df, metric, facet_col, title, wrap=3):
+@timed()
+def plot_facet_histogram(df, metric, facet_col, title, wrap=3, pre_aggregated=False):
+    """Con pre_aggregated=True, df es Sketches.VisitSketches.histogram(metric, by=facet_col)."""
+    if pre_aggregated:
+        df = df.assign(**{metric: (df['Desde'] + df['Hasta']) / 2, 'Ancho': df['Hasta'] - df['Desde']})
+        fig = px.bar(
+            df, x=metric, y='Conteo', facet_col=facet_col, facet_col_wrap=wrap,
+            title=title, labels={'Conteo': 'count'}, custom_data=['Ancho'],
+            color_discrete_sequence=[PALETTE[2]]
+        )
+        # Las barras de los extremos (fuera de rango) son más anchas que las regulares
+        fig.for_each_trace(lambda t: t.update(width=[c[0] for c in t.customdata]))
+        fig.update_traces(marker_line_color=FONT_COLOR, marker_line_width=1)
+        fig.update_layout(BASE_LAYOUT, bargap=0)
+        return fig
     fig = px.histogram(
         df, x=metric, facet_col=facet_col, facet_col_wrap=wrap,
         title=title, labels={metric: metric},
@@ -232,9 +324,14 @@ def plot_facet_histogram(df, metric, facet_col, title, wrap=3):
     fig.update_layout(BASE_LAYOUT)
     return fig
 
-def plot_demand_heatmap(df, date_col, category_col, title):
-    df['Hora'] = df[date_col].dt.hour
-    daily = df.groupby([df[date_col].dt.date, 'Hora', category_col]).size().reset_index(name='Count')
+@timed()
+def plot_demand_heatmap(df, date_col, category_col, title, pre_aggregated=False):
+    if pre_aggregated:
+        # Conteos ya agregados por [category_col, Fecha, Hora] (ver load_dashboard_aggregates)
+        daily = df
+    else:
+        hora = df[date_col].dt.hour.rename('Hora')
+        daily = df.groupby([df[date_col].dt.date, hora, df[category_col]]).size().reset_index(name='Count')
     pivot = daily.groupby(['Hora', category_col])['Count'].mean().unstack(fill_value=0)
     fig = go.Figure(go.Heatmap(
         z=pivot.values, x=pivot.columns, y=pivot.index,
@@ -249,12 +346,16 @@ def plot_demand_heatmap(df, date_col, category_col, title):
     )
     return fig
 
-def plot_avg_demand_line(df, date_col, category_col, title):
-    df['Hora'] = df[date_col].dt.hour
-    df['Fecha'] = df[date_col].dt.date
+@timed()
+def plot_avg_demand_line(df, date_col, category_col, title, pre_aggregated=False):
+    if pre_aggregated:
+        daily_counts = df
+    else:
+        hora = df[date_col].dt.hour.rename('Hora')
+        fecha = df[date_col].dt.date.rename('Fecha')
 
-    # Conteo diario por hora y sucursal
-    daily_counts = df.groupby([category_col, 'Fecha', 'Hora']).size().reset_index(name='Count')
+        # Conteo diario por hora y sucursal (sin escribir columnas en df, que puede ser compartido)
+        daily_counts = df.groupby([df[category_col], fecha, hora]).size().reset_index(name='Count')
 
     # Promedio diario por hora y sucursal
     avg_counts = daily_counts.groupby([category_col, 'Hora'])['Count'].mean().reset_index(name='Avg')
@@ -269,8 +370,9 @@ def plot_avg_demand_line(df, date_col, category_col, title):
     return fig
 
 
-def plot_bar_avg_total_time(df):
-    avg = df.groupby('Sucursal')['TotalTiempo'].mean().reset_index()
+@timed()
+def plot_bar_avg_total_time(df, pre_aggregated=False):
+    avg = df if pre_aggregated else df.groupby('Sucursal')['TotalTiempo'].mean().reset_index()
     fig = px.bar(
         avg, x='Sucursal', y='TotalTiempo',
         title="Tiempo Total Promedio por Sucursal",
@@ -280,8 +382,12 @@ def plot_bar_avg_total_time(df):
     fig.update_layout(BASE_LAYOUT, showlegend=False)
     return fig
 
-def plot_stacked_area_daily_counts(df):
-    daily = df.groupby(['FechaDT', 'Sucursal']).size().reset_index(name='Count')
+@timed()
+def plot_stacked_area_daily_counts(df, pre_aggregated=False):
+    if pre_aggregated:
+        daily = df.sort_values('FechaDT')
+    else:
+        daily = df.groupby(['FechaDT', 'Sucursal']).size().reset_index(name='Count')
     fig = px.area(
         daily, x='FechaDT', y='Count', color='Sucursal',
         title="Pacientes Diarios por Sucursal (Área Apilada)",
@@ -0,0 +1,418 @@
+"""
+Backends.py
+
+Backends de almacenamiento para DataLoader y las utilidades de carga.
+  - SqlServerBackend: Azure SQL Server vía ODBC, credenciales desde Key Vault
+  - SQLiteBackend / DuckDBBackend: archivo local embebido, sin red, para
+    pruebas de carga y perfilado offline
+
+Se elige con las variables de entorno:
+  DATA_BACKEND      "sqlserver" (default), "sqlite" o "duckdb"
+  DATA_LOCAL_PATH   archivo de la base local (default data/local.db)
+
+Publicación versionada: cada carga va a una tabla `<tabla>_limpia_AAAAMMDD_HHMMSS`
+y el nombre lógico `<tabla>` es un sinónimo (SQL Server) o una vista (SQLite,
+DuckDB) que `swap_version` redirige a la versión nueva en una sola transacción.
+"""
+
+import datetime as dt
+import logging
+import os
+import re
+import sqlite3
+import urllib
+from contextlib import closing
+from typing import List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_PATH = os.path.join("data", "local.db")
+# pandas>=2 infiere un único formato por columna; ISO8601 admite segundos con y sin fracción
+_ISO_FORMAT = {"format": "ISO8601"} if int(pd.__version__.split(".")[0]) >= 2 else {}
+
+# Sufijo de las versiones de una tabla publicada
+# Versiones: _limpia_AAAAMMDD_HHMMSS_ffffff (las publicadas antes, sin microsegundos)
+VERSION_SUFFIX = re.compile(r"_limpia_\d{8}_\d{6}(?:_\d{6})?$")
+# Nombre que recibe una tabla previa a la publicación versionada al adoptarla
+LEGACY_STAMP = "00000000_000000"
+# Tabla detrás de la vista en el SQL guardado por SQLite/DuckDB
+_VIEW_SOURCE = re.compile(r'FROM\s+(?:"((?:[^"]|"")+)"|([^\s;]+))\s*;?\s*$', re.IGNORECASE)
+
+
+def version_name(table: str, stamp: Optional[str] = None) -> str:
+    """
+    Nombre de una versión de `table` (por defecto, con la hora actual en microsegundos,
+    para que dos publicaciones en el mismo segundo no compartan nombre).
+    """
+    return f"{table}_limpia_{stamp or dt.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+
+
+def versions_of(table: str, names: List[str]) -> List[str]:
+    """Versiones de `table` entre `names`, de la más antigua a la más reciente."""
+    pattern = re.compile(re.escape(table) + VERSION_SUFFIX.pattern)
+    return sorted(n for n in names if pattern.match(n))
+
+
+def restore_temporal(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte las columnas DATE/TIME que pyodbc devuelve como objetos datetime.date /
+    datetime.time a datetime64 / timedelta64 (en el lugar; devuelve el mismo df).
+    """
+    for col in df.columns[df.dtypes == object]:
+        valores = df[col].dropna()
+        if valores.empty:
+            continue
+        primero = valores.iloc[0]
+        if isinstance(primero, dt.time):
+            df[col] = pd.to_timedelta(df[col].map(dt.time.isoformat, na_action="ignore"), errors="coerce")
+        elif type(primero) is dt.date:
+            df[col] = pd.to_datetime(df[col], errors="coerce").astype("datetime64[ns]")
+    return df
+
+
+def _view_source(sql: Optional[str]) -> Optional[str]:
+    match = _VIEW_SOURCE.search(sql or "")
+    if not match:
+        return None
+    return match.group(1).replace('""', '"') if match.group(1) else match.group(2)
+
+
+class SqlServerBackend:
+    """Azure SQL Server vía pyodbc/SQLAlchemy."""
+
+    name = "sqlserver"
+
+    def __init__(self, secret_prefix: str = "", connect_timeout: int = 30):
+        # Dependencias de Azure/ODBC solo cuando se usa este backend
+        from SecretKeys import SecretKeys
+
+        prefix = f"{secret_prefix}_" if secret_prefix else ""
+
+        # Leer secretos en paralelo (una sola ronda contra el Key Vault)
+        names = ["SERVER", "DATABASE", "USER", "PASSWORD", "DRIVER"]
+        values = SecretKeys().prefetch(prefix + n for n in names)
+        self._server = values[prefix + "SERVER"]
+        self._database = values[prefix + "DATABASE"]
+        self._user = values[prefix + "USER"]
+        self._password = values[prefix + "PASSWORD"]
+        self._driver = values[prefix + "DRIVER"] or "{ODBC Driver 17 for SQL Server}"
+
+        self._timeout = connect_timeout
+
+        # Cadena ODBC para pyodbc (lecturas y cargas masivas)
+        self.odbc_str = (
+            f"DRIVER={self._driver};"
+            f"SERVER={self._server},1433;"
+            f"DATABASE={self._database};"
+            f"UID={self._user};PWD={self._password};"
+            "Encrypt=yes;TrustServerCertificate=no;"
+        )
+
+        # Motor para inspección de tablas y DDL
+        self.engine = self._create_engine()
+
+    def _create_engine(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.exc import OperationalError
+
+        odbc = self.odbc_str + f"Connection Timeout={self._timeout};"
+        params = urllib.parse.quote_plus(odbc)
+        url = f"mssql+pyodbc:///?odbc_connect={params}"
+        try:
+            engine = create_engine(
+                url,
+                fast_executemany=True,
+                pool_pre_ping=True,
+            )
+            with engine.connect():
+                logger.info("Conectado a %s/%s", self._server, self._database)
+            return engine
+        except OperationalError as err:
+            logger.exception("La conexión a la base de datos falló: %s", err)
+            raise
+
+    def connect(self):
+        """Conexión pyodbc nueva (el llamador la cierra)."""
+        import pyodbc
+
+        return pyodbc.connect(self.odbc_str, timeout=self._timeout)
+
+    @staticmethod
+    def quote(name: str) -> str:
+        return f"[{name}]"
+
+    def select_query(self, table: str, nrows: Optional[int] = None) -> str:
+        top_clause = f"TOP {nrows}" if nrows else ""
+        return f"SELECT {top_clause} * FROM {self.quote(table)}"
+
+    float_type = "FLOAT"
+
+    @staticmethod
+    def date_part(part: str, expr: str) -> str:
+        """Expresión SQL para fecha, hora o día de la semana (lunes=0) de `expr`."""
+        if part == "date":
+            return f"CAST({expr} AS DATE)"
+        if part == "hour":
+            return f"DATEPART(HOUR, {expr})"
+        # Independiente de SET DATEFIRST
+        return f"((DATEPART(WEEKDAY, {expr}) + @@DATEFIRST + 5) % 7)"
+
+    def list_tables(self) -> List[str]:
+        """Tablas de usuario y sinónimos (nombres de tablas publicadas)."""
+        from sqlalchemy import inspect, text
+
+        tables = inspect(self.engine).get_table_names()
+        with self.engine.connect() as conn:
+            synonyms = [r[0] for r in conn.execute(text("SELECT name FROM sys.synonyms"))]
+        return sorted(set(tables) | set(synonyms))
+
+    def read_sql(self, query: str, table: Optional[str] = None) -> pd.DataFrame:
+        with self.connect() as conn:
+            return restore_temporal(pd.read_sql(query, con=conn))
+
+    def current_version(self, table: str) -> Optional[str]:
+        """Tabla a la que apunta el sinónimo `table` (None si no está publicada)."""
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            base = conn.execute(
+                text("SELECT base_object_name FROM sys.synonyms WHERE name = :name"),
+                {"name": table},
+            ).scalar()
+        # base_object_name viene como [esquema].[tabla]
+        return base.split("].[")[-1].strip("[]") if base else None
+
+    def swap_version(self, table: str, version: str) -> None:
+        """Apunta el sinónimo `table` a `version` en una transacción (adopta una tabla previa)."""
+        from sqlalchemy import text
+
+        legacy = version_name(table, LEGACY_STAMP)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+            SET XACT_ABORT ON;
+            IF OBJECT_ID(N'dbo.{self.quote(table)}', N'U') IS NOT NULL
+                EXEC sp_rename N'dbo.{self.quote(table)}', N'{legacy}';
+            IF OBJECT_ID(N'dbo.{self.quote(table)}', N'SN') IS NOT NULL
+                DROP SYNONYM dbo.{self.quote(table)};
+            CREATE SYNONYM dbo.{self.quote(table)} FOR dbo.{self.quote(version)};
+            """))
+
+    def drop_table(self, table: str) -> None:
+        """Elimina la tabla o, si es un nombre publicado, solo su sinónimo."""
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+            IF OBJECT_ID(N'dbo.{self.quote(table)}', N'SN') IS NOT NULL
+                DROP SYNONYM dbo.{self.quote(table)};
+            ELSE
+                DROP TABLE {self.quote(table)};
+            """))
+
+
+class SQLiteBackend:
+    """Archivo SQLite local (solo biblioteca estándar)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_LOCAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        logger.info("Usando base local SQLite en %s", path)
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def quote(name: str) -> str:
+        return '"' + name.replace('"', '""') + '"'
+
+    def select_query(self, table: str, nrows: Optional[int] = None) -> str:
+        limit_clause = f" LIMIT {int(nrows)}" if nrows else ""
+        return f"SELECT * FROM {self.quote(table)}{limit_clause}"
+
+    float_type = "REAL"
+
+    @staticmethod
+    def date_part(part: str, expr: str) -> str:
+        if part == "date":
+            return f"date({expr})"
+        if part == "hour":
+            return f"CAST(strftime('%H', {expr}) AS INTEGER)"
+        return f"((CAST(strftime('%w', {expr}) AS INTEGER) + 6) % 7)"
+
+    def list_tables(self) -> List[str]:
+        """Tablas y vistas (nombres de tablas publicadas)."""
+        with closing(self.connect()) as conn, conn:
+            rows = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _object_type(self, conn, name: str) -> Optional[str]:
+        row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def current_version(self, table: str) -> Optional[str]:
+        """Tabla detrás de la vista `table` (None si no está publicada)."""
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (table,)
+            ).fetchone()
+        return _view_source(row[0]) if row else None
+
+    def swap_version(self, table: str, version: str) -> None:
+        """Redirige la vista `table` a `version` en una transacción (adopta una tabla previa)."""
+        with closing(self.connect()) as conn:
+            legacy = ""
+            if self._object_type(conn, table) == "table":
+                legacy = f"ALTER TABLE {self.quote(table)} RENAME TO {self.quote(version_name(table, LEGACY_STAMP))};"
+            conn.executescript(f"""
+            BEGIN IMMEDIATE;
+            {legacy}
+            DROP VIEW IF EXISTS {self.quote(table)};
+            CREATE VIEW {self.quote(table)} AS SELECT * FROM {self.quote(version)};
+            COMMIT;
+            """)
+
+    def _datetime_columns(self, conn, table: str) -> List[str]:
+        # SQLite guarda fechas como texto; el tipo declarado dice cuáles reconstruir
+        info = conn.execute(f"PRAGMA table_info({self.quote(table)})").fetchall()
+        return [row[1] for row in info if row[2].upper() in ("TIMESTAMP", "DATETIME", "DATE")]
+
+    def read_sql(self, query: str, table: Optional[str] = None) -> pd.DataFrame:
+        with closing(self.connect()) as conn, conn:
+            parse = self._datetime_columns(conn, table) if table else None
+            df = pd.read_sql(query, con=conn)
+        for col in parse or []:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors="coerce", **_ISO_FORMAT)
+        return df
+
+    def write_table(self, table: str, df: pd.DataFrame, if_exists: str = "replace") -> int:
+        """Escribe el DataFrame en la tabla y devuelve el número de filas."""
+        with closing(self.connect()) as conn, conn:
+            df.to_sql(table, conn, if_exists=if_exists, index=False, chunksize=100_000)
+        return len(df)
+
+    def create_indexes(self, table: str, columns: List[str]) -> None:
+        with closing(self.connect()) as conn, conn:
+            for col in columns:
+                ix = self.quote(f"IX_{table}_{col.replace(' ', '_')}")
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {ix} ON {self.quote(table)} ({self.quote(col)})"
+                )
+
+    def drop_table(self, table: str) -> None:
+        """Elimina la tabla o, si es un nombre publicado, solo su vista."""
+        with closing(self.connect()) as conn, conn:
+            kind = "VIEW" if self._object_type(conn, table) == "view" else "TABLE"
+            conn.execute(f"DROP {kind} IF EXISTS {self.quote(table)}")
+
+
+class DuckDBBackend(SQLiteBackend):
+    """Archivo DuckDB local (columnar, requiere el paquete duckdb)."""
+
+    name = "duckdb"
+
+    def __init__(self, path: str = DEFAULT_LOCAL_PATH):
+        try:
+            import duckdb
+        except ImportError as err:
+            raise ImportError("DATA_BACKEND=duckdb requiere `pip install duckdb`") from err
+        self._duckdb = duckdb
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        logger.info("Usando base local DuckDB en %s", path)
+
+    def connect(self):
+        return self._duckdb.connect(self.path)
+
+    float_type = "DOUBLE"
+
+    @staticmethod
+    def date_part(part: str, expr: str) -> str:
+        if part == "date":
+            return f"CAST({expr} AS DATE)"
+        if part == "hour":
+            return f"hour({expr})"
+        return f"(isodow({expr}) - 1)"
+
+    def list_tables(self) -> List[str]:
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT table_name FROM information_schema.tables "
+                "WHERE table_schema = 'main' ORDER BY table_name"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _object_type(self, conn, name: str) -> Optional[str]:
+        row = conn.execute(
+            "SELECT table_type FROM information_schema.tables "
+            "WHERE table_schema = 'main' AND table_name = ?", [name]
+        ).fetchone()
+        if not row:
+            return None
+        return "view" if row[0] == "VIEW" else "table"
+
+    def current_version(self, table: str) -> Optional[str]:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT sql FROM duckdb_views() WHERE view_name = ? AND NOT internal", [table]
+            ).fetchone()
+        return _view_source(row[0]) if row else None
+
+    def swap_version(self, table: str, version: str) -> None:
+        with self.connect() as conn:
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                if self._object_type(conn, table) == "table":
+                    legacy = self.quote(version_name(table, LEGACY_STAMP))
+                    conn.execute(f"ALTER TABLE {self.quote(table)} RENAME TO {legacy}")
+                conn.execute(f"CREATE OR REPLACE VIEW {self.quote(table)} AS SELECT * FROM {self.quote(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def drop_table(self, table: str) -> None:
+        with self.connect() as conn:
+            kind = "VIEW" if self._object_type(conn, table) == "view" else "TABLE"
+            conn.execute(f"DROP {kind} IF EXISTS {self.quote(table)}")
+
+    def read_sql(self, query: str, table: Optional[str] = None) -> pd.DataFrame:
+        # DuckDB conserva los tipos de fecha, no hace falta reconstruirlos
+        with self.connect() as conn:
+            return conn.execute(query).df()
+
+    def write_table(self, table: str, df: pd.DataFrame, if_exists: str = "replace") -> int:
+        with self.connect() as conn:
+            conn.register("_df_carga", df)
+            if if_exists == "replace":
+                conn.execute(f"CREATE OR REPLACE TABLE {self.quote(table)} AS SELECT * FROM _df_carga")
+            else:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {self.quote(table)} AS SELECT * FROM _df_carga LIMIT 0")
+                conn.execute(f"INSERT INTO {self.quote(table)} SELECT * FROM _df_carga")
+            conn.unregister("_df_carga")
+        return len(df)
+
+    def create_indexes(self, table: str, columns: List[str]) -> None:
+        # DuckDB usa zonemaps por columna; los índices ART no ayudan a escaneos analíticos
+        pass
+
+
+def make_backend(kind: Optional[str] = None, secret_prefix: str = "", connect_timeout: int = 30,
+                 local_path: Optional[str] = None):
+    """Crea el backend indicado por `kind` o por la variable DATA_BACKEND."""
+    kind = (kind or os.getenv("DATA_BACKEND", "sqlserver")).lower()
+    local_path = local_path or os.getenv("DATA_LOCAL_PATH", DEFAULT_LOCAL_PATH)
+    if kind == "sqlserver":
+        return SqlServerBackend(secret_prefix, connect_timeout)
+    if kind == "sqlite":
+        return SQLiteBackend(local_path)
+    if kind == "duckdb":
+        return DuckDBBackend(local_path)
+    raise ValueError(f"DATA_BACKEND desconocido: {kind}")
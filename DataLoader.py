@@ -1,74 +1,72 @@
 import logging
-import re
-import urllib
-from typing import List, Optional
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import pandas as pd
-import pyodbc
-from sqlalchemy import create_engine, inspect
-from sqlalchemy.engine import Engine
-from sqlalchemy.exc import OperationalError
-from azure.core.exceptions import AzureError
 
-from SecretKeys import SecretKeys
+from Backends import VERSION_SUFFIX, make_backend
+from Metrics import stage
 
 # Configura el logging
 default_format = "%(asctime)s [%(levelname)s] %(message)s"
 logging.basicConfig(level=logging.INFO, format=default_format)
 logger = logging.getLogger(__name__)
 
-class DataLoader:
-    def __init__(self, secret_prefix: str = "", connect_timeout: int = 30):
-        self._secrets = SecretKeys()
-        prefix = f"{secret_prefix}_" if secret_prefix else ""
+AGG_FUNCS = {"count": "COUNT", "sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX"}
+DATE_PARTS = ("date", "hour", "weekday")
+# Segundos entre consultas al catálogo para detectar versiones nuevas de una tabla
+VERSION_CHECK_SECONDS = float(os.getenv("VERSION_CHECK_SECONDS", "30"))
 
-        # Verificar credenciales de Azure Key Vault
-        try:
-            self._secrets._credential.get_token("https://vault.azure.net/.default")
-        except AzureError as err:
-            logger.warning("La verificación de credenciales de Azure falló: %s", err)
-
-        # Leer secretos
-        self._server = self._secrets.get(prefix + "SERVER")
-        self._database = self._secrets.get(prefix + "DATABASE")
-        self._user = self._secrets.get(prefix + "USER")
-        self._password = self._secrets.get(prefix + "PASSWORD")
-        self._driver = self._secrets.get(prefix + "DRIVER") or "{ODBC Driver 17 for SQL Server}"
-
-        self._timeout = connect_timeout
-
-        # Motor para inspección de tablas
-        self.engine: Engine = self._create_engine()
-        self.inspector = inspect(self.engine)
-
-    def _create_engine(self) -> Engine:
-        odbc = (
-            f"DRIVER={self._driver};"
-            f"SERVER={self._server},1433;"
-            f"DATABASE={self._database};"
-            f"UID={self._user};PWD={self._password};"
-            "Encrypt=yes;TrustServerCertificate=no;"
-            f"Connection Timeout={self._timeout};"
+class DataLoader:
+    def __init__(self, secret_prefix: str = "", connect_timeout: int = 30, backend=None):
+        # Backend de datos: SQL Server (default) o base local según DATA_BACKEND
+        self.backend = backend or make_backend(
+            secret_prefix=secret_prefix, connect_timeout=connect_timeout
         )
-        params = urllib.parse.quote_plus(odbc)
-        url = f"mssql+pyodbc:///?odbc_connect={params}"
-        try:
-            engine = create_engine(
-                url,
-                fast_executemany=True,
-                pool_pre_ping=True,
-            )
-            with engine.connect():
-                logger.info("Conectado a %s/%s", self._server, self._database)
-            return engine
-        except OperationalError as err:
-            logger.exception("La conexión a la base de datos falló: %s", err)
-            raise
+        # Motor SQLAlchemy (solo SQL Server)
+        self.engine = getattr(self.backend, "engine", None)
+        # tabla -> (versión vista por última vez, momento de la consulta)
+        self._versions: Dict[str, Tuple[str, float]] = {}
+        self._versions_lock = threading.Lock()
 
     def list_tables(self) -> List[str]:
-        """Lista todas las tablas de usuario, excluyendo temporales/limpias."""
-        tables = self.inspector.get_table_names()
-        return [t for t in tables if not re.search(r"_limpia_\d{8}_\d{6}$", t)]
+        """Lista todas las tablas de usuario, excluyendo las versiones (_limpia_)."""
+        tables = self.backend.list_tables()
+        return [t for t in tables if not VERSION_SUFFIX.search(t)]
+
+    def table_version(self, table: str) -> str:
+        """
+        Versión publicada de la tabla (una consulta al catálogo); la propia tabla si
+        no es versionada. Queda registrada como la última vista por `version_changed`.
+        """
+        version = self.backend.current_version(table) or table
+        with self._versions_lock:
+            self._versions[table] = (version, time.monotonic())
+        return version
+
+    def known_version(self, table: str) -> str:
+        """Última versión vista de `table` (ver `table_version`) sin consultar el catálogo."""
+        with self._versions_lock:
+            seen = self._versions.get(table)
+        return seen[0] if seen is not None else self.table_version(table)
+
+    def version_changed(self, table: str, interval: Optional[float] = None) -> bool:
+        """
+        True si se publicó una versión nueva de `table` desde la última vista.
+        Consulta el catálogo a lo más cada `interval` segundos (VERSION_CHECK_SECONDS).
+        """
+        interval = VERSION_CHECK_SECONDS if interval is None else interval
+        with self._versions_lock:
+            seen = self._versions.get(table)
+        if seen is not None and time.monotonic() - seen[1] < interval:
+            return False
+        version = self.table_version(table)
+        if seen is not None and seen[0] != version:
+            logger.info("Nueva versión de '%s': %s", table, version)
+            return True
+        return False
 
     def load_table(
         self,
@@ -76,26 +74,15 @@ class DataLoader:
         nrows: Optional[int] = None,
         sample_frac: Optional[float] = None
     ) -> pd.DataFrame:
-        """Carga datos de una tabla específica (solo desde 1980) usando pyodbc puro."""
-        # Construir consulta con filtro numérico en Fecha
-        top_clause = f"TOP {nrows}" if nrows else ""
-        query = (
-            f"SELECT {top_clause} * "
-            f"FROM [{table}] "
-        )
-
-        # Cadena ODBC para pyodbc
-        odbc_str = (
-            f"DRIVER={self._driver};"
-            f"SERVER={self._server},1433;"
-            f"DATABASE={self._database};"
-            f"UID={self._user};PWD={self._password};"
-            "Encrypt=yes;TrustServerCertificate=no;"
-        )
+        """Carga datos de una tabla específica usando la conexión nativa del backend."""
+        query = self.backend.select_query(table, nrows)
 
         try:
-            with pyodbc.connect(odbc_str, timeout=self._timeout) as conn:
-                df = pd.read_sql(query, con=conn)
+            # La etiqueta es el nombre lógico: una por tabla, no una por versión publicada
+            with stage("load_table", table=VERSION_SUFFIX.sub("", table)) as st:
+                df = self.backend.read_sql(query, table=table)
+                st.rows = len(df)
+                st.bytes = int(df.memory_usage(index=False, deep=False).sum())
         except Exception as e:
             logger.exception("Error al cargar datos de la tabla %s: %s", table, e)
             raise
@@ -108,3 +95,66 @@ class DataLoader:
 
 
         return df.reset_index(drop=True)
+
+    def aggregate(
+        self,
+        table: str,
+        group_by: Sequence[Union[str, Tuple[str, ...]]],
+        metrics: Dict[str, Tuple[str, Union[str, Tuple[str, ...]]]],
+        not_null: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Agrega en el servidor con GROUP BY y devuelve solo las filas agregadas.
+
+        group_by: columnas, o tuplas (parte, columna[, alias]) con parte en
+                  "date", "hour" o "weekday" (lunes=0). Alias por defecto: la parte.
+        metrics:  {alias: (func, columna)} con func en count/sum/avg/min/max;
+                  columna "*" para COUNT(*) o una tupla de columnas que se suman.
+        not_null: columnas que deben ser no nulas (equivale al dropna previo).
+        """
+        b = self.backend
+        keys, date_aliases = [], []
+        for g in group_by:
+            if isinstance(g, str):
+                keys.append((b.quote(g), g))
+                continue
+            part, col = g[0], g[1]
+            if part not in DATE_PARTS:
+                raise ValueError(f"Parte de fecha no soportada: {part}")
+            alias = g[2] if len(g) > 2 else part
+            keys.append((b.date_part(part, b.quote(col)), alias))
+            if part == "date":
+                date_aliases.append(alias)
+
+        select = [f"{expr} AS {b.quote(alias)}" for expr, alias in keys]
+        for alias, (func, col) in metrics.items():
+            if func not in AGG_FUNCS:
+                raise ValueError(f"Función de agregación no soportada: {func}")
+            if col == "*":
+                arg = "*"
+            else:
+                cols = (col,) if isinstance(col, str) else col
+                arg = " + ".join(b.quote(c) for c in cols)
+                if func == "avg":
+                    # AVG sobre enteros trunca en SQL Server
+                    arg = f"CAST({arg} AS {b.float_type})"
+            select.append(f"{AGG_FUNCS[func]}({arg}) AS {b.quote(alias)}")
+
+        query = f"SELECT {', '.join(select)} FROM {b.quote(table)}"
+        if not_null:
+            query += " WHERE " + " AND ".join(f"{b.quote(c)} IS NOT NULL" for c in not_null)
+        if keys:
+            query += " GROUP BY " + ", ".join(expr for expr, _ in keys)
+
+        try:
+            with stage("aggregate", table=VERSION_SUFFIX.sub("", table)) as st:
+                df = b.read_sql(query)
+                st.rows = len(df)
+                st.bytes = int(df.memory_usage(index=False, deep=False).sum())
+        except Exception as e:
+            logger.exception("Error al agregar datos de la tabla %s: %s", table, e)
+            raise
+
+        for alias in date_aliases:
+            df[alias] = pd.to_datetime(df[alias], errors="coerce")
+        return df.dropna(subset=[alias for _, alias in keys]).reset_index(drop=True)
@@ -0,0 +1,162 @@
+"""
+Forecast.py
+
+Pronóstico de demanda por sucursal y hora para alimentar optimize_staff.
+
+Todas las sucursales se ajustan a la vez con operaciones de NumPy sobre un
+tensor sucursal x día x hora:
+  - perfil día-de-semana x hora (forma intradía y factor semanal)
+  - suavizamiento exponencial de Holt amortiguado sobre el total diario
+    desestacionalizado, con alfa elegido por sucursal en una rejilla
+
+Los parámetros ajustados se guardan por versión de datos (ver `get_forecast`).
+"""
+
+from typing import Callable, Hashable
+
+import numpy as np
+import pandas as pd
+
+from Metrics import timed
+from VersionCache import VersionCache
+
+HOURS = np.arange(6, 20)
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7])
+BETA = 0.05
+PHI = 0.9
+# Número de versiones de datos con pronóstico en memoria
+CACHE_SIZE = 8
+
+
+def build_tensor(df, hours=HOURS):
+    """
+    Conteo de visitas por sucursal x día x hora a partir de SUCURSAL/FECHA/HORA.
+    Devuelve (tensor[B, D, H], sucursales, primer_día).
+    """
+    fechas = pd.to_datetime(df['FECHA'], errors='coerce').dt.normalize()
+    b_idx, branches = pd.factorize(df['SUCURSAL'], sort=True)
+    h_idx = df['HORA'].to_numpy() - hours[0]
+    valid = fechas.notna().to_numpy() & (b_idx >= 0) & (h_idx >= 0) & (h_idx < len(hours))
+    if not valid.any():
+        raise ValueError('No hay visitas con fecha y hora válidas para pronosticar')
+
+    first_day = fechas[valid].min()
+    d_idx = (fechas - first_day).dt.days.to_numpy()[valid].astype(np.int64)
+    B, D, H = len(branches), int(d_idx.max()) + 1, len(hours)
+
+    flat = (b_idx[valid] * D + d_idx) * H + h_idx[valid]
+    tensor = np.bincount(flat, minlength=B * D * H).reshape(B, D, H).astype(float)
+    return tensor, list(branches), first_day
+
+
+def historical_mean(tensor):
+    """Media por hora sobre los días con al menos una visita en esa hora (como build_figure)."""
+    n = (tensor > 0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, tensor.sum(axis=1) / n, 0.0)
+
+
+class ForecastModel:
+    """Parámetros ajustados para todas las sucursales."""
+
+    def __init__(self, branches, hours, last_day, level, trend, weekday_factor, shape, alpha,
+                 historical):
+        self.branches = branches
+        self.hours = hours
+        self.last_day = last_day
+        self.level = level                    # [B]
+        self.trend = trend                    # [B]
+        self.weekday_factor = weekday_factor  # [B, 7]
+        self.shape = shape                    # [B, 7, H]
+        self.alpha = alpha                    # [B]
+        self.historical = historical          # [B, H] media histórica (como build_figure)
+
+    def predict(self, days: int) -> np.ndarray:
+        """Demanda esperada por hora para los próximos `days` días: [B, days, H]."""
+        k = np.arange(1, days + 1)
+        damp = np.cumsum(PHI ** k)                                             # [days]
+        level = np.maximum(self.level[:, None] + self.trend[:, None] * damp, 0)  # [B, days]
+        wd = (self.last_day.dayofweek + k) % 7                                 # [days]
+        daily = level * self.weekday_factor[:, wd]                             # [B, days]
+        return daily[:, :, None] * self.shape[:, wd, :]
+
+    def demand_frame(self, horizon: int = 1) -> pd.DataFrame:
+        """Demanda sucursal x hora del día `horizon` (1 = día siguiente al último dato)."""
+        pred = self.predict(horizon)[:, horizon - 1, :]
+        return pd.DataFrame(pred, index=self.branches, columns=self.hours)
+
+    def historical_frame(self) -> pd.DataFrame:
+        """Media histórica sucursal x hora, equivalente a Model.historical_demand."""
+        return pd.DataFrame(self.historical, index=self.branches, columns=self.hours)
+
+    def target_day(self, horizon: int = 1) -> pd.Timestamp:
+        return self.last_day + pd.Timedelta(days=horizon)
+
+
+@timed()
+def fit(df, hours=HOURS) -> ForecastModel:
+    """Ajusta perfil semanal x horario y Holt amortiguado para todas las sucursales."""
+    tensor, branches, first_day = build_tensor(df, hours)
+    B, D, H = tensor.shape
+    daily = tensor.sum(axis=2)                                    # [B, D]
+    open_ = daily > 0                                             # [B, D]
+    wd = (first_day.dayofweek + np.arange(D)) % 7                 # [D]
+    onehot = np.eye(7)[wd]                                        # [D, 7]
+
+    # Perfil día-de-semana x hora sobre días abiertos
+    sums = np.einsum('bdh,dw->bwh', tensor, onehot)               # [B, 7, H]
+    n_open = open_.astype(float) @ onehot                         # [B, 7]
+    mean_daily = daily.sum(axis=1) / np.maximum(open_.sum(axis=1), 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        wd_mean = sums.sum(axis=2) / n_open                       # [B, 7]
+        weekday_factor = np.where(n_open > 0, wd_mean / mean_daily[:, None], 0.0)
+        overall_shape = sums.sum(axis=1) / sums.sum(axis=(1, 2))[:, None]
+        shape = sums / sums.sum(axis=2, keepdims=True)
+    shape = np.where(np.isfinite(shape), shape, np.nan_to_num(overall_shape)[:, None, :])
+
+    # Total diario desestacionalizado
+    s_day = weekday_factor[:, wd]                                 # [B, D]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(open_ & (s_day > 0), daily / s_day, 0.0)
+
+    # Holt amortiguado, todas las alfas x sucursales en paralelo; se recorre el tiempo
+    A = len(ALPHAS)
+    alpha = ALPHAS[:, None]
+    level = np.tile(mean_daily, (A, 1))                           # [A, B]
+    trend = np.zeros((A, B))
+    sse = np.zeros((A, B))
+    for d in range(D):
+        m = open_[:, d]
+        pred = level + PHI * trend
+        err = np.where(m, z[:, d] - pred, 0.0)
+        sse += err ** 2
+        new_level = pred + alpha * err
+        new_trend = BETA * (new_level - level) + (1 - BETA) * PHI * trend
+        level = np.where(m, new_level, level)
+        trend = np.where(m, new_trend, trend)
+
+    best = sse.argmin(axis=0)                                     # [B]
+    cols = np.arange(B)
+    last_day = first_day + pd.Timedelta(days=D - 1)
+    return ForecastModel(
+        branches, hours, last_day,
+        level=level[best, cols], trend=trend[best, cols],
+        weekday_factor=weekday_factor, shape=shape, alpha=ALPHAS[best],
+        historical=historical_mean(tensor),
+    )
+
+
+_CACHE = VersionCache(fit, CACHE_SIZE)
+
+
+def get_forecast(version: Hashable, load: Callable[[], pd.DataFrame]) -> ForecastModel:
+    """
+    Modelo ajustado para la versión de datos `version`. Solo la primera vez se llama a
+    `load()` (DataFrame con SUCURSAL/FECHA/HORA) y se ajusta.
+    """
+    return _CACHE.get(version, load)
+
+
+def invalidate(table: str) -> None:
+    """Descarta las versiones guardadas de `table` (llaves (tabla, versión))."""
+    _CACHE.invalidate(table)
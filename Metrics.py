@@ -0,0 +1,315 @@
+"""
+Metrics.py
+
+Instrumentación ligera por etapa (SQL, agregación en pandas, MILP, serialización
+Plotly): duración, filas y bytes por etapa, expuestos en formato Prometheus y,
+opcionalmente, como perfil por request.
+
+  METRICS_ENABLED=0   desactiva la medición (las etapas no hacen nada)
+  METRICS_DIR=<dir>   directorio compartido para sumar las métricas de varios procesos
+
+Las métricas viven en memoria del proceso. Con METRICS_DIR (gunicorn.conf.py lo
+fija por defecto) cada proceso vuelca las suyas a `<dir>/metrics_<pid>.json` y
+/metrics suma todos los archivos, así que cualquier worker expone los totales.
+"""
+
+import atexit
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+# Segundos entre volcados del proceso a METRICS_DIR
+FLUSH_SECONDS = 1.0
+
+# Límites superiores (segundos) del histograma de duración
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_LOCK = threading.Lock()
+# {(etapa, labels ordenados): {"count", "sum", "rows", "bytes", "buckets"}}
+_STATS: Dict[tuple, dict] = {}
+# Perfil del request en curso (None si no se está perfilando)
+_PROFILE: ContextVar[Optional[List[dict]]] = ContextVar("profile", default=None)
+# Hay métricas sin volcar / pid del proceso cuyo hilo de volcado está corriendo
+_dirty = False
+_flusher_pid: Optional[int] = None
+
+
+class Stage:
+    """Registro de una etapa; el código medido puede fijar `rows` y `bytes`."""
+
+    __slots__ = ("name", "labels", "rows", "bytes", "seconds")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.rows = None
+        self.bytes = None
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "labels": self.labels,
+            "seconds": round(self.seconds, 6),
+            "rows": self.rows,
+            "bytes": self.bytes,
+        }
+
+
+class _NullStage:
+    """Etapa vacía para cuando la medición está desactivada."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _StageTimer:
+    __slots__ = ("stage", "_t0")
+
+    def __init__(self, name: str, labels: dict):
+        self.stage = Stage(name, labels)
+
+    def __enter__(self) -> Stage:
+        self._t0 = time.perf_counter()
+        return self.stage
+
+    def __exit__(self, *exc):
+        self.stage.seconds = time.perf_counter() - self._t0
+        record(self.stage)
+        return False
+
+
+def stage(name: str, **labels):
+    """
+    Context manager que mide una etapa:
+
+        with stage("load_table", table=t) as st:
+            df = ...
+            st.rows = len(df)
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return _StageTimer(name, labels)
+
+
+def record(st: Stage) -> None:
+    """Acumula una etapa en las métricas del proceso y en el perfil activo."""
+    key = (st.name, tuple(sorted(st.labels.items())))
+    with _LOCK:
+        agg = _STATS.get(key)
+        if agg is None:
+            agg = _STATS[key] = {"count": 0, "sum": 0.0, "rows": 0, "bytes": 0,
+                                 "buckets": [0] * len(BUCKETS)}
+        agg["count"] += 1
+        agg["sum"] += st.seconds
+        agg["rows"] += st.rows or 0
+        agg["bytes"] += st.bytes or 0
+        for i, le in enumerate(BUCKETS):
+            if st.seconds <= le:
+                agg["buckets"][i] += 1
+    if METRICS_DIR:
+        _mark_dirty()
+    profile = _PROFILE.get()
+    if profile is not None:
+        profile.append(st.as_dict())
+
+
+def _is_frame(obj) -> bool:
+    return hasattr(obj, "memory_usage") and hasattr(obj, "__len__")
+
+
+def _describe(obj):
+    """Filas y bytes aproximados de un DataFrame/Serie/str sin recorrer los datos."""
+    if _is_frame(obj):
+        mem = obj.memory_usage(index=False, deep=False)
+        return len(obj), int(mem.sum() if hasattr(mem, "sum") else mem)
+    if isinstance(obj, (str, bytes)):
+        return None, len(obj)
+    return None, None
+
+
+def timed(name: Optional[str] = None):
+    """
+    Decorador: mide la función como etapa; las filas salen del primer DataFrame/Serie
+    entre los argumentos (así en métodos no se toma `self`) o, si no hay, del resultado.
+    """
+
+    def decorator(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with stage(stage_name) as st:
+                result = fn(*args, **kwargs)
+                frame = next((a for a in args if _is_frame(a)), None)
+                if frame is not None:
+                    st.rows, st.bytes = _describe(frame)
+                if st.rows is None:
+                    st.rows, st.bytes = _describe(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+# ---------- Perfil por request ----------
+
+def start_profile() -> None:
+    _PROFILE.set([])
+
+
+def stop_profile() -> List[dict]:
+    profile = _PROFILE.get() or []
+    _PROFILE.set(None)
+    return profile
+
+
+# ---------- Agregación entre procesos ----------
+
+def _snapshot() -> Dict[tuple, dict]:
+    with _LOCK:
+        return {k: dict(v, buckets=list(v["buckets"])) for k, v in _STATS.items()}
+
+
+def flush() -> None:
+    """Vuelca las métricas del proceso a METRICS_DIR (escritura atómica)."""
+    global _dirty
+    if not METRICS_DIR:
+        return
+    _dirty = False
+    data = [[name, [list(kv) for kv in labels], agg] for (name, labels), agg in _snapshot().items()]
+    path = os.path.join(METRICS_DIR, f"metrics_{os.getpid()}.json")
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(tmp, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        if _dirty:
+            flush()
+
+
+def _mark_dirty() -> None:
+    """Marca métricas pendientes y arranca el hilo de volcado del proceso si falta."""
+    global _dirty, _flusher_pid
+    _dirty = True
+    if _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(flush)
+
+
+def _merged() -> Dict[tuple, dict]:
+    """Suma de las métricas de todos los procesos que volcaron en METRICS_DIR."""
+    if not METRICS_DIR:
+        return _snapshot()
+    flush()
+    total: Dict[tuple, dict] = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics_*.json")):
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        for name, labels, agg in data:
+            key = (name, tuple(tuple(kv) for kv in labels))
+            acc = total.get(key)
+            if acc is None:
+                total[key] = dict(agg, buckets=list(agg["buckets"]))
+                continue
+            for field in ("count", "sum", "rows", "bytes"):
+                acc[field] += agg[field]
+            acc["buckets"] = [a + b for a, b in zip(acc["buckets"], agg["buckets"])]
+    return total
+
+
+def _after_fork() -> None:
+    """El hijo empieza de cero: lo medido antes del fork ya está en el archivo del padre."""
+    global _LOCK, _dirty
+    _LOCK = threading.Lock()
+    _STATS.clear()
+    _dirty = False
+
+
+if METRICS_DIR and hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=flush, after_in_child=_after_fork)
+
+
+# ---------- Exposición Prometheus ----------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: tuple, le: Optional[str] = None) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus() -> str:
+    """Texto en formato de exposición de Prometheus (version 0.0.4), sumando procesos."""
+    snapshot = _merged()
+
+    lines = [
+        "# HELP saluddigna_stage_seconds Duración de cada etapa del pipeline.",
+        "# TYPE saluddigna_stage_seconds histogram",
+    ]
+    for (name, labels), agg in sorted(snapshot.items()):
+        base = (("stage", name),) + labels
+        for le, n in zip(BUCKETS, agg["buckets"]):
+            lines.append(f"saluddigna_stage_seconds_bucket{_fmt_labels(base, str(le))} {n}")
+        lines.append(f"saluddigna_stage_seconds_bucket{_fmt_labels(base, '+Inf')} {agg['count']}")
+        lines.append(f"saluddigna_stage_seconds_sum{_fmt_labels(base)} {agg['sum']:.6f}")
+        lines.append(f"saluddigna_stage_seconds_count{_fmt_labels(base)} {agg['count']}")
+
+    lines += [
+        "# HELP saluddigna_stage_rows_total Filas procesadas por etapa.",
+        "# TYPE saluddigna_stage_rows_total counter",
+    ]
+    for (name, labels), agg in sorted(snapshot.items()):
+        lines.append(f"saluddigna_stage_rows_total{_fmt_labels((('stage', name),) + labels)} {agg['rows']}")
+
+    lines += [
+        "# HELP saluddigna_stage_bytes_total Bytes producidos o leídos por etapa.",
+        "# TYPE saluddigna_stage_bytes_total counter",
+    ]
+    for (name, labels), agg in sorted(snapshot.items()):
+        lines.append(f"saluddigna_stage_bytes_total{_fmt_labels((('stage', name),) + labels)} {agg['bytes']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _LOCK:
+        _STATS.clear()
+    flush()
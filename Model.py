@@ -2,33 +2,68 @@
 
 import pandas as pd
 import numpy as np
-from scipy.optimize import milp, LinearConstraint, Bounds
+from scipy.optimize import milp, linprog, LinearConstraint, Bounds
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from DataLoader import DataLoader
+from Metrics import timed
 
 # Paleta de colores y estilos
 PALETTE = ['#597D72', '#B59F7B', '#C8B1A3']
 BG_COLOR = '#FAF8F0'
 FONT_COLOR = '#1B3B36'
 
-def load_and_preprocess():
+@timed()
+def load_and_preprocess(table=None):
     loader = DataLoader()
-    tables = loader.list_tables()
-    if not tables:
-        raise ValueError('No hay datos disponibles')
-    df = loader.load_table(tables[0])
-    df.columns = df.columns.str.upper().str.replace(' ', '_')
-    df['FECHA'] = pd.to_datetime(df.get('FECHA'), errors='coerce')
-    hora_col = [c for c in df.columns if 'HORA_INICIO' in c][0]
-    df['HORA'] = pd.to_datetime(df[hora_col], errors='coerce').dt.hour.fillna(0).astype(int)
-    return df
-
-
-def optimize_staff(demand, full_shifts, part_shifts, cost_full, cost_part, capacity):
+    if table is None:
+        tables = loader.list_tables()
+        if not tables:
+            raise ValueError('No hay datos disponibles')
+        table = tables[0]
+    return preprocess(loader.load_table(table))
+
+
+def preprocess(df):
+    """
+    Extrae SUCURSAL, FECHA y HORA (hora de inicio) para build_figure.
+    Solo copia esas tres columnas, así puede usarse sobre tablas ya cacheadas.
+    """
+    upper = {c: c.upper().replace(' ', '_') for c in df.columns}
+    by_upper = {u: c for c, u in upper.items()}
+    hora_col = [c for c, u in upper.items() if 'HORA_INICIO' in u][0]
+    return pd.DataFrame({
+        'SUCURSAL': df[by_upper['SUCURSAL']].to_numpy(),
+        'FECHA': pd.to_datetime(df[by_upper['FECHA']], errors='coerce').to_numpy(),
+        'HORA': pd.to_datetime(df[hora_col], errors='coerce').dt.hour.fillna(0).astype(int).to_numpy(),
+    })
+
+
+def _round_lp(c, A_ub, b_ub):
+    """
+    Heurística rápida: relajación LP, redondeo hacia arriba (sigue siendo factible
+    porque todas las restricciones son >= con coeficientes no negativos) y poda
+    greedy de los turnos más caros. Devuelve (x, cota inferior LP).
+    """
+    res = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=(0, None), method='highs')
+    x = np.ceil(res.x - 1e-9)
+    for k in np.argsort(-c, kind='stable'):
+        while x[k] > 0 and np.all(A_ub @ x - A_ub[:, k] <= b_ub + 1e-9):
+            x[k] -= 1
+    return x, res.fun
+
+
+@timed()
+def optimize_staff(demand, full_shifts, part_shifts, cost_full, cost_part, capacity, min_staff=None,
+                   mode='exact', time_limit=None, info=None):
     """
     Optimiza la asignación de empleados full-time y part-time.
-    Asegura cobertura mínima (>= demanda) y al menos un empleado en cada hora.
+    Asegura cobertura mínima (>= demanda) y al menos un empleado en cada hora
+    (o `min_staff` por hora, p. ej. el piso de Queueing.staffing_floor).
+
+    mode='fast': relajación LP + redondeo (milisegundos); mode='exact': MILP con
+    `time_limit` opcional en segundos. Si se da `info` (dict), se llena con el
+    costo, la cota inferior y la brecha de optimalidad.
     """
     I, J = len(full_shifts), len(part_shifts)
     # Costos por turno
@@ -50,27 +85,70 @@ def optimize_staff(demand, full_shifts, part_shifts, cost_full, cost_part, capac
                 A[t_idx, j] = capacity
                 B[t_idx, j] = 1
 
-    # Restricción: A * x >= demanda
-    cons_capacity = LinearConstraint(-A, -np.inf, -demand.values)
-    # Restricción: B * x >= 1 (al menos un empleado cada hora)
-    cons_min_presence = LinearConstraint(-B, -np.inf, -np.ones(T))
-
-    # Resolver MILP
-    res = milp(
-        c=c,
-        constraints=[cons_capacity, cons_min_presence],
-        bounds=Bounds(0, np.inf),
-        integrality=np.ones(I + J, int)
-    )
+    # Piso de presencia: al menos un empleado cada hora
+    floor = np.ones(T) if min_staff is None else np.maximum(np.asarray(min_staff, dtype=float), 1)
+
+    if mode == 'fast':
+        x, bound = _round_lp(c, -np.vstack([A, B]), -np.concatenate([demand.values, floor]))
+        method = 'heuristic'
+    else:
+        # Restricción: A * x >= demanda
+        cons_capacity = LinearConstraint(-A, -np.inf, -demand.values)
+        # Restricción: B * x >= piso
+        cons_min_presence = LinearConstraint(-B, -np.inf, -floor)
 
-    x = np.round(res.x).astype(int)
+        # Resolver MILP
+        res = milp(
+            c=c,
+            constraints=[cons_capacity, cons_min_presence],
+            bounds=Bounds(0, np.inf),
+            integrality=np.ones(I + J, int),
+            options={'time_limit': time_limit} if time_limit else None
+        )
+        if res.x is None:
+            # Sin solución entera dentro del tiempo límite: se usa la heurística
+            x, bound = _round_lp(c, -np.vstack([A, B]), -np.concatenate([demand.values, floor]))
+            method = 'heuristic'
+        else:
+            x = res.x
+            bound = getattr(res, 'mip_dual_bound', None)
+            method = 'exact' if res.status == 0 else 'time_limit'
+
+    x = np.round(x).astype(int)
+    if info is not None:
+        cost = float(c @ x)
+        if bound is None or not np.isfinite(bound):
+            bound = cost
+        info.update(method=method, cost=cost, bound=float(bound),
+                    gap=max(cost - bound, 0.0) / cost if cost else 0.0)
     full_sol = dict(zip(full_shifts.keys(), x[:I]))
     part_sol = dict(zip(part_shifts.keys(), x[I:]))
     return full_sol, part_sol
 
 
-def build_figure(df, cost_full, cost_part, capacity):
-    branches = sorted(df['SUCURSAL'].unique())
+def historical_demand(df):
+    """
+    Media de pacientes por sucursal x hora (6-19) sobre los días con visitas en esa hora.
+    Un solo groupby para todas las sucursales.
+    """
+    daily = df.groupby(['SUCURSAL', df['FECHA'].dt.date.rename('DIA'), 'HORA']).size()
+    return (daily.groupby(level=['SUCURSAL', 'HORA']).mean()
+            .unstack(fill_value=0)
+            .reindex(index=sorted(df['SUCURSAL'].unique()), columns=range(6, 20), fill_value=0))
+
+
+@timed()
+def build_figure(df, cost_full, cost_part, capacity, full_hours=8, part_hours=4, demand=None,
+                 min_staff=None, solver='exact', time_limit=None, info=None):
+    """
+    demand: DataFrame sucursal x hora con los pacientes a cubrir (p. ej. de Forecast);
+    si no se da, se usa la media histórica de `df`.
+    min_staff: DataFrame sucursal x hora con el mínimo de empleados (p. ej. de Queueing).
+    solver/time_limit: modo de optimize_staff; `info` (dict) recibe su resumen por sucursal.
+    """
+    if demand is None:
+        demand = historical_demand(df)
+    branches = list(demand.index)
     fig = make_subplots(
         rows=2, cols=1, shared_xaxes=True,
         subplot_titles=('Empleados vs Pacientes', 'Costos por Hora')
@@ -78,25 +156,27 @@ def build_figure(df, cost_full, cost_part, capacity):
 
     all_vis = []
     for branch in branches:
-        ndf = df[df['SUCURSAL'] == branch]
-        daily = ndf.groupby([ndf['FECHA'].dt.date.rename('DIA'), 'HORA']) \
-                   .size().reset_index(name='CNT')
- 
-        avg = daily.groupby('HORA')['CNT'] \
-           .mean().reindex(range(6, 20), fill_value=0)
+        avg = demand.loc[branch].rename_axis('HORA')
 
         min_hour = avg.index.min()
         max_hour = avg.index.max() + 1
 
 
-        full_shifts = {f'FT_{h}': list(range(h, h + 8)) for h in range(min_hour, max_hour-7)}
-        part_shifts = {f'PT_{h}': list(range(h, h + 4)) for h in range(min_hour, max_hour-3)}
+        full_shifts = {f'FT_{h}': list(range(h, h + full_hours))
+                       for h in range(min_hour, max_hour - full_hours + 1)}
+        part_shifts = {f'PT_{h}': list(range(h, h + part_hours))
+                       for h in range(min_hour, max_hour - part_hours + 1)}
 
 
+        floor = None if min_staff is None else min_staff.loc[branch].reindex(avg.index, fill_value=1)
+        branch_info = {} if info is not None else None
         full_sol, part_sol = optimize_staff(
             avg, full_shifts, part_shifts,
-            cost_full, cost_part, capacity
+            cost_full, cost_part, capacity, min_staff=floor,
+            mode=solver, time_limit=time_limit, info=branch_info
         )
+        if info is not None:
+            info[branch] = branch_info
 
         cov_ft = pd.Series(0, index=avg.index)
         cov_pt = pd.Series(0, index=avg.index)
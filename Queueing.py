@@ -0,0 +1,84 @@
+"""
+Queueing.py
+
+Modelo de colas M/M/c (Erlang C) para estimar, por sucursal x hora x número de
+empleados, la espera esperada y la probabilidad de esperar más de 20 minutos.
+
+  - llegadas: pacientes por hora (p. ej. Forecast.ForecastModel.historical_frame())
+  - servicio: minutos promedio de atención por sucursal ('Minutos de atencion')
+
+Todo se evalúa con arreglos de NumPy [B, H, C]; la recursión de Erlang B avanza
+sobre C (número de empleados) para todas las sucursales y horas a la vez.
+"""
+
+import numpy as np
+import pandas as pd
+
+from Metrics import timed
+
+# Umbral de espera que mide Cumple_20min
+WAIT_THRESHOLD = 20.0
+
+
+def max_servers_for(load: np.ndarray) -> int:
+    """Empleados suficientes para cubrir la carga más alta con holgura."""
+    peak = float(np.nanmax(load)) if load.size else 0.0
+    return max(1, int(np.ceil(peak + 4 * np.sqrt(peak) + 3)))
+
+
+@timed('erlang_c')
+def evaluate(arrivals, service_minutes, max_servers=None, threshold=WAIT_THRESHOLD):
+    """
+    arrivals: [B, H] pacientes por hora; service_minutes: [B] o [B, H] minutos por paciente.
+    Devuelve (espera_min[B, H, C], p_mas_umbral[B, H, C], niveles[C]) con niveles = 1..C.
+    La espera es inf y la probabilidad 1 cuando la cola es inestable (c <= carga).
+    """
+    lam = np.asarray(arrivals, dtype=float)
+    service = np.asarray(service_minutes, dtype=float)
+    if service.ndim == 1:
+        service = service[:, None]
+    mu = 60.0 / np.maximum(service, 1e-9)            # pacientes por hora por empleado
+    load = lam / mu                                  # carga ofrecida (erlangs)
+    C = max_servers or max_servers_for(load)
+    levels = np.arange(1, C + 1)
+
+    # Erlang B por recursión sobre c: B(c) = a B(c-1) / (c + a B(c-1))
+    erlang_b = np.empty(lam.shape + (C,))
+    b = np.ones_like(load)
+    for i, c in enumerate(levels):
+        b = load * b / (c + load * b)
+        erlang_b[..., i] = b
+
+    c = levels.astype(float)
+    a = load[..., None]
+    stable = c > a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Erlang C: probabilidad de esperar
+        p_wait = np.where(stable, c * erlang_b / (c - a * (1 - erlang_b)), 1.0)
+        drain = c * mu[..., None] - lam[..., None]   # tasa de vaciado (por hora)
+        wait = np.where(stable, p_wait / drain * 60.0, np.inf)
+        p_over = np.where(stable, p_wait * np.exp(-drain * threshold / 60.0), 1.0)
+    # Sin llegadas no hay espera
+    idle = (lam <= 0)[..., None]
+    wait = np.where(idle, 0.0, wait)
+    p_over = np.where(idle, 0.0, p_over)
+    return wait, p_over, levels
+
+
+def staffing_floor(p_over: np.ndarray, service_level: float) -> np.ndarray:
+    """
+    Mínimo de empleados por sucursal x hora para que al menos `service_level`
+    de los pacientes espere menos del umbral. Si no se alcanza, el máximo evaluado.
+    """
+    ok = p_over <= 1.0 - service_level
+    return np.where(ok.any(axis=-1), ok.argmax(axis=-1) + 1, p_over.shape[-1])
+
+
+def staffing_floor_frame(arrivals: pd.DataFrame, service_minutes: pd.Series,
+                         service_level: float) -> pd.DataFrame:
+    """Piso de empleados sucursal x hora, alineado con `arrivals` (para build_figure)."""
+    service = service_minutes.reindex(arrivals.index)
+    service = service.fillna(service.mean())
+    _, p_over, _ = evaluate(arrivals.to_numpy(), service.to_numpy())
+    return pd.DataFrame(staffing_floor(p_over, service_level),
+                        index=arrivals.index, columns=arrivals.columns)
@@ -5,11 +5,19 @@ secret_keys.py
 Clase simple para leer secretos de Azure Key Vault.
 Requiere las variables de entorno:
   KEY_VAULT_URL, AZURE_TENANT_ID, AZURE_CLIENT_ID, AZURE_CLIENT_SECRET
+Opcionales:
+  SECRETS_TTL          segundos de vida de la caché de secretos (default 3600)
+  SECRETS_CACHE_FILE   ruta de una caché local cifrada compartida entre procesos
+  SECRETS_CACHE_KEY    clave Fernet para cifrar SECRETS_CACHE_FILE
 """
 
 import os
+import json
+import time
 import logging
-from functools import lru_cache
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
 
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
@@ -17,9 +25,18 @@ from azure.core.exceptions import AzureError
 from dotenv import load_dotenv
 
 
+# Caché de secretos compartida por todas las instancias del proceso:
+# {nombre: (valor, expira_en)}
+_CACHE: Dict[str, tuple] = {}
+_CACHE_LOCK = threading.Lock()
+
+
 class SecretKeys:
     """Helper Class to retrieve secrets from Azure Key Vault"""
 
+    # La verificación de credenciales se hace una sola vez por proceso
+    _verified = False
+
     def __init__(self) -> None:
         load_dotenv()                              # Lee el .env si existe
         self._vault_url = os.getenv("KEY_VAULT_URL")
@@ -31,7 +48,12 @@ class SecretKeys:
             vault_url=self._vault_url,
             credential=self._credential
         )
-        self._verify_credentials()
+        self._ttl = float(os.getenv("SECRETS_TTL", "3600"))
+        self._cache_file = os.getenv("SECRETS_CACHE_FILE")
+        self._cache_key = os.getenv("SECRETS_CACHE_KEY")
+        self._load_cache_file()
+        if not SecretKeys._verified:
+            self._verify_credentials()
 
     # ---------- Métodos privados ----------
 
@@ -39,22 +61,117 @@ class SecretKeys:
         """Comprueba que podamos obtener un token"""
         try:
             self._credential.get_token("https://vault.azure.net/.default")
+            SecretKeys._verified = True
             logging.info("Credenciales de Azure verificadas correctamente.")
         except AzureError as err:
             logging.warning(
                 "No se pudieron verificar las credenciales de Azure: %s", err
             )
 
-    # ---------- API pública ----------
+    def _fernet(self):
+        """Devuelve el cifrador de la caché local, o None si no está configurada"""
+        if not (self._cache_file and self._cache_key):
+            return None
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            logging.warning("cryptography no está instalado; caché local de secretos desactivada.")
+            return None
+        try:
+            return Fernet(self._cache_key.encode())
+        except (ValueError, TypeError) as err:
+            # Llave mal formada: se desactiva la caché en lugar de tumbar el proceso
+            logging.warning("SECRETS_CACHE_KEY inválida (%s); caché local de secretos desactivada.", err)
+            self._cache_key = None
+            return None
 
-    @lru_cache(maxsize=32)
-    def get(self, secret_name: str) -> str:
-        """Devuelve el valor de un secreto"""
+    def _load_cache_file(self) -> None:
+        """Carga en memoria los secretos vigentes de la caché local cifrada"""
+        fernet = self._fernet()
+        if fernet is None or not os.path.exists(self._cache_file):
+            return
+        try:
+            with open(self._cache_file, "rb") as fh:
+                data = json.loads(fernet.decrypt(fh.read()))
+        except Exception as err:
+            logging.warning("No se pudo leer la caché local de secretos: %s", err)
+            return
+        now = time.time()
+        with _CACHE_LOCK:
+            for name, (value, expires) in data.items():
+                if expires > now and name not in _CACHE:
+                    _CACHE[name] = (value, expires)
+
+    def _save_cache_file(self) -> None:
+        """Escribe la caché vigente en el archivo local cifrado (escritura atómica)"""
+        fernet = self._fernet()
+        if fernet is None:
+            return
+        now = time.time()
+        with _CACHE_LOCK:
+            data = {k: v for k, v in _CACHE.items() if v[1] > now}
+        tmp = f"{self._cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as fh:
+                fh.write(fernet.encrypt(json.dumps(data).encode()))
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self._cache_file)
+        except OSError as err:
+            logging.warning("No se pudo escribir la caché local de secretos: %s", err)
+
+    def _cached(self, secret_name: str):
+        with _CACHE_LOCK:
+            entry = _CACHE.get(secret_name)
+        if entry and entry[1] > time.time():
+            return entry
+        return None
+
+    def _fetch(self, secret_name: str) -> str:
+        """Lee un secreto del Key Vault y lo guarda en la caché del proceso"""
         try:
-            return self._client.get_secret(secret_name).value
+            value = self._client.get_secret(secret_name).value
         except AzureError as err:
             logging.error("Error al leer el secreto '%s': %s", secret_name, err)
             raise
+        with _CACHE_LOCK:
+            _CACHE[secret_name] = (value, time.time() + self._ttl)
+        return value
+
+    # ---------- API pública ----------
+
+    def get(self, secret_name: str) -> str:
+        """Devuelve el valor de un secreto"""
+        entry = self._cached(secret_name)
+        if entry:
+            return entry[0]
+        value = self._fetch(secret_name)
+        self._save_cache_file()
+        return value
+
+    def prefetch(self, secret_names: Iterable[str]) -> Dict[str, str]:
+        """Obtiene varios secretos en paralelo y devuelve {nombre: valor}"""
+        names = list(dict.fromkeys(secret_names))
+        result = {}
+        missing = []
+        for name in names:
+            entry = self._cached(name)
+            if entry:
+                result[name] = entry[0]
+            else:
+                missing.append(name)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                for name, value in zip(missing, pool.map(self._fetch, missing)):
+                    result[name] = value
+            self._save_cache_file()
+        return result
+
+    @staticmethod
+    def clear_cache() -> None:
+        """Vacía la caché de secretos del proceso"""
+        with _CACHE_LOCK:
+            _CACHE.clear()
 
     # ---------- Utilidades estáticas ----------
 
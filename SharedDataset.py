@@ -0,0 +1,194 @@
+"""
+SharedDataset.py
+
+Dataset compartido entre workers de gunicorn mediante archivos Arrow IPC en
+memoria compartida (/dev/shm). Un proceso publica una versión; los workers la
+mapean con mmap, de modo que las columnas numéricas y de fecha se leen sin copia
+y el sistema operativo mantiene una sola copia física para todos.
+
+Para que eso valga también con datos faltantes, los flotantes se guardan con NaN
+como valor y las fechas como timestamp[ns] con el centinela de NaT, en lugar de
+nulos de Arrow: una columna con nulos se copiaría en cada worker al leerla.
+
+  SHARED_DATASET_DIR   directorio de los archivos (default /dev/shm/saluddigna)
+
+Las versiones se publican escribiendo el archivo completo y luego reemplazando
+de forma atómica el puntero `<nombre>.current`; los workers detectan el cambio
+con un `stat` del puntero (ver `refresh`). Requiere pyarrow; `get_or_publish`
+usa `fcntl` (solo POSIX), que se importa al llamarla para que el módulo (y
+`DEFAULT_DIR`) se pueda importar también en Windows.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = "/dev/shm/saluddigna" if os.path.isdir("/dev/shm") else os.path.join(
+    tempfile.gettempdir(), "saluddigna")
+# Versiones anteriores que se conservan para workers que aún no refrescan
+KEEP_VERSIONS = 2
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as err:
+        raise ImportError("SHARED_DATASET=1 requiere `pip install pyarrow`") from err
+    return pa
+
+
+class SharedDataset:
+    """Tabla versionada en memoria compartida, publicada por un proceso y leída por todos."""
+
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self._pa = _pyarrow()
+        self.name = name.replace(os.sep, "_")
+        self.directory = directory or os.getenv("SHARED_DATASET_DIR", DEFAULT_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self._pointer = os.path.join(self.directory, f"{self.name}.current")
+        self._pointer_mtime = None
+        self.version = None
+        # Versión de la tabla de origen publicada (ver DataLoader.table_version)
+        self.source = None
+        self.df: Optional[pd.DataFrame] = None
+
+    # ---------- Métodos privados ----------
+
+    def _to_arrow(self, df: pd.DataFrame):
+        """Tabla Arrow sin máscara de nulos en flotantes y fechas (ver docstring del módulo)."""
+        pa = self._pa
+        arrays = []
+        for col in df.columns:
+            serie = df[col]
+            dtype = serie.dtype
+            if isinstance(dtype, np.dtype) and dtype.kind == "f":
+                arr = pa.array(serie.to_numpy(), from_pandas=False)
+            elif isinstance(dtype, np.dtype) and dtype.kind == "M":
+                ints = serie.to_numpy().astype("datetime64[ns]").view("i8")
+                arr = pa.array(ints).view(pa.timestamp("ns"))
+            else:
+                arr = pa.array(serie, from_pandas=True)
+            arrays.append(arr)
+        return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+    def _read_pointer(self) -> Optional[dict]:
+        try:
+            with open(self._pointer) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _map(self, info: dict) -> pd.DataFrame:
+        """Mapea el archivo Arrow y lo expone como DataFrame (sin copia donde se puede)."""
+        pa = self._pa
+        source = pa.memory_map(info["path"], "r")
+        table = pa.ipc.open_file(source).read_all()
+        # El texto queda como string[pyarrow] sobre el mismo buffer (sin objetos Python
+        # por fila); split_blocks evita consolidar columnas en bloques nuevos (copias)
+        string_dtype = pd.StringDtype("pyarrow")
+        types = {pa.string(): string_dtype, pa.large_string(): string_dtype}
+        return table.to_pandas(split_blocks=True, self_destruct=False, types_mapper=types.get)
+
+    def _cleanup(self, current: str) -> None:
+        prefix = f"{self.name}-"
+        files = sorted(
+            f for f in os.listdir(self.directory)
+            if f.startswith(prefix) and f.endswith(".arrow")
+        )
+        # Borrar un archivo mapeado es seguro en Linux: los workers conservan el mapeo
+        for f in files[:-KEEP_VERSIONS]:
+            if f != os.path.basename(current):
+                try:
+                    os.remove(os.path.join(self.directory, f))
+                except OSError:
+                    pass
+
+    # ---------- API pública ----------
+
+    def publish(self, df: pd.DataFrame, source: Optional[str] = None) -> str:
+        """
+        Escribe una nueva versión y la activa de forma atómica. Devuelve la versión.
+        `source` identifica los datos de origen (p. ej. la versión de la tabla).
+        """
+        pa = self._pa
+        version = time.strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+        path = os.path.join(self.directory, f"{self.name}-{version}.arrow")
+
+        table = self._to_arrow(df)
+
+        tmp = path + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+
+        pointer_tmp = f"{self._pointer}.{os.getpid()}.tmp"
+        with open(pointer_tmp, "w") as fh:
+            json.dump({"version": version, "path": path, "rows": table.num_rows, "source": source}, fh)
+        os.replace(pointer_tmp, self._pointer)
+
+        logger.info("Dataset '%s' publicado: versión %s (%s filas)", self.name, version, table.num_rows)
+        self._cleanup(path)
+        return version
+
+    def refresh(self) -> bool:
+        """Adjunta la versión vigente si cambió. Devuelve True si hubo cambio."""
+        try:
+            mtime = os.stat(self._pointer).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._pointer_mtime:
+            return False
+        info = self._read_pointer()
+        if info is None or info["version"] == self.version:
+            self._pointer_mtime = mtime
+            return False
+        try:
+            self.df = self._map(info)
+        except OSError as err:
+            logger.warning("No se pudo adjuntar el dataset '%s': %s", self.name, err)
+            return False
+        self.version = info["version"]
+        self.source = info.get("source")
+        self._pointer_mtime = mtime
+        logger.info("Dataset '%s' adjuntado: versión %s (pid %s)", self.name, self.version, os.getpid())
+        return True
+
+    def release(self) -> None:
+        """Suelta el mapeo local; el próximo `refresh` vuelve a adjuntar la versión vigente."""
+        self.df = None
+        self.version = None
+        self.source = None
+        self._pointer_mtime = None
+
+    def get_or_publish(self, load: Callable[[], pd.DataFrame], source: Optional[str] = None) -> pd.DataFrame:
+        """
+        Adjunta la versión vigente o, si no existe (o proviene de otro `source`), la
+        carga con `load()` y la publica. Un lock de archivo asegura que solo un
+        proceso cargue desde la base de datos.
+        """
+        self.refresh()
+        if self.df is not None and (source is None or self.source == source):
+            return self.df
+        import fcntl
+
+        with open(self._pointer + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Otro proceso pudo publicar mientras esperábamos el lock
+                self.refresh()
+                if self.df is None or (source is not None and self.source != source):
+                    self.publish(load(), source=source)
+                    self.refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return self.df
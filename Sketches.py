@@ -0,0 +1,230 @@
+"""
+Sketches.py
+
+Resúmenes combinables de las distribuciones de tiempos (espera, atención, total)
+para las gráficas de distribución: histogramas de ancho fijo por sucursal, por
+día de semana y por día, de los que también se estiman cuantiles.
+
+Los histogramas se actualizan de forma incremental con `update(df)` y se combinan
+sumando conteos (`merge`), así que las vistas cuestan O(bins) y no O(visitas).
+Con bins de 1 minuto los cuantiles tienen un error menor a un minuto; los valores
+por encima de MAX_MINUTES caen en un bin de desborde.
+"""
+
+from typing import Callable, Hashable, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from Metrics import timed
+from VersionCache import VersionCache
+
+METRICS = ('Minutos de espera', 'Minutos de atencion', 'TotalTiempo')
+# Dimensiones por las que se guarda cada histograma (None = todas las visitas)
+DIMENSIONS = (None, 'Sucursal', 'DiaSemana', 'Dia')
+BIN_WIDTH = 1.0
+MAX_MINUTES = 720
+QUANTILES = (0.25, 0.5, 0.75)
+# Número de versiones de datos con resúmenes en memoria
+CACHE_SIZE = 8
+
+
+class HistogramSet:
+    """
+    Un histograma de ancho fijo por llave. `counts[k]` tiene un bin de subdesborde
+    (< 0), los bins [i*ancho, (i+1)*ancho) y uno de desborde (>= max_value).
+    """
+
+    def __init__(self, bin_width: float = BIN_WIDTH, max_value: float = MAX_MINUTES):
+        self.bin_width = bin_width
+        self.n_bins = int(np.ceil(max_value / bin_width))
+        self.keys: list = []
+        self._index: dict = {}
+        self.counts = np.zeros((0, self.n_bins + 2), dtype=np.int64)
+        self.sums = np.zeros(0)
+        self.mins = np.zeros(0)
+        self.maxs = np.zeros(0)
+
+    # ---------- Métodos privados ----------
+
+    def _rows(self, keys: Sequence) -> np.ndarray:
+        """Fila de cada llave, agregando las nuevas."""
+        new = [k for k in keys if k not in self._index]
+        if new:
+            for k in new:
+                self._index[k] = len(self.keys)
+                self.keys.append(k)
+            n = len(new)
+            self.counts = np.vstack([self.counts, np.zeros((n, self.n_bins + 2), dtype=np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros(n)])
+            self.mins = np.concatenate([self.mins, np.full(n, np.inf)])
+            self.maxs = np.concatenate([self.maxs, np.full(n, -np.inf)])
+        return np.array([self._index[k] for k in keys], dtype=np.int64)
+
+    # ---------- API pública ----------
+
+    def update(self, keys, values) -> None:
+        """Agrega valores; `keys` y `values` son arreglos alineados (se ignoran nulos)."""
+        keys = pd.Series(keys)
+        values = np.asarray(values, dtype=float)
+        valid = keys.notna().to_numpy() & ~np.isnan(values)
+        if not valid.any():
+            return
+        codes, uniques = pd.factorize(keys[valid])
+        values = values[valid]
+        rows = self._rows(list(uniques))[codes]
+
+        bins = np.floor(values / self.bin_width).astype(np.int64) + 1
+        bins = np.clip(bins, 0, self.n_bins + 1)
+        width = self.n_bins + 2
+        flat = np.bincount(rows * width + bins, minlength=len(self.keys) * width)
+        self.counts += flat.reshape(len(self.keys), width)
+        self.sums += np.bincount(rows, weights=values, minlength=len(self.keys))
+        np.minimum.at(self.mins, rows, values)
+        np.maximum.at(self.maxs, rows, values)
+
+    def merge(self, other: "HistogramSet") -> None:
+        """Suma los conteos de otro conjunto con el mismo ancho de bin."""
+        if (other.bin_width, other.n_bins) != (self.bin_width, self.n_bins):
+            raise ValueError('Solo se combinan histogramas con los mismos bins')
+        rows = self._rows(other.keys)
+        self.counts[rows] += other.counts
+        self.sums[rows] += other.sums
+        self.mins[rows] = np.minimum(self.mins[rows], other.mins)
+        self.maxs[rows] = np.maximum(self.maxs[rows], other.maxs)
+
+    def totals(self) -> np.ndarray:
+        return self.counts.sum(axis=1)
+
+    def quantiles(self, qs: Iterable[float] = QUANTILES) -> np.ndarray:
+        """Cuantiles por llave interpolando dentro del bin: [llaves, len(qs)]."""
+        qs = np.asarray(list(qs), dtype=float)
+        n = self.totals()
+        cum = np.cumsum(self.counts, axis=1)
+        out = np.full((len(self.keys), len(qs)), np.nan)
+        for k in np.flatnonzero(n):
+            target = qs * n[k]
+            b = np.searchsorted(cum[k], target, side='left')
+            prev = np.where(b > 0, cum[k][np.maximum(b - 1, 0)], 0)
+            frac = (target - prev) / np.maximum(self.counts[k][b], 1)
+            # Los bins de sub/desborde no tienen ancho conocido: se usa el extremo observado
+            lower = (b - 1) * self.bin_width
+            est = lower + frac * self.bin_width
+            est = np.where(b == 0, self.mins[k], est)
+            est = np.where(b == self.n_bins + 1, self.maxs[k], est)
+            out[k] = np.clip(est, self.mins[k], self.maxs[k])
+        return out
+
+
+class VisitSketches:
+    """Histogramas de METRICS por cada dimensión de DIMENSIONS."""
+
+    def __init__(self, metrics: Sequence[str] = METRICS, bin_width: float = BIN_WIDTH,
+                 max_value: float = MAX_MINUTES):
+        self.metrics = list(metrics)
+        self.sets = {
+            (metric, dim): HistogramSet(bin_width, max_value)
+            for metric in self.metrics for dim in DIMENSIONS
+        }
+        self.rows = 0
+
+    @staticmethod
+    def _keys(df: pd.DataFrame, dim: Optional[str]):
+        if dim is None:
+            return np.zeros(len(df), dtype=np.int64)
+        if dim == 'Dia':
+            return df['InicioEsperaDT'].dt.normalize().to_numpy()
+        return df[dim].to_numpy()
+
+    @timed('sketch_update')
+    def update(self, df: pd.DataFrame) -> "VisitSketches":
+        """Agrega visitas ya preprocesadas (ver Analisis.preprocess_visits)."""
+        for dim in DIMENSIONS:
+            keys = self._keys(df, dim)
+            for metric in self.metrics:
+                self.sets[(metric, dim)].update(keys, df[metric].to_numpy(dtype=float, na_value=np.nan))
+        self.rows += len(df)
+        return self
+
+    def merge(self, other: "VisitSketches") -> "VisitSketches":
+        for key, hs in other.sets.items():
+            self.sets[key].merge(hs)
+        self.rows += other.rows
+        return self
+
+    def histogram(self, metric: str, by: Optional[str] = None, bins: int = 40) -> pd.DataFrame:
+        """
+        Histograma pre-binneado con ~`bins` barras sobre el rango observado:
+        [by, Desde, Hasta, Conteo, Densidad] (sin `by` si es None). Los valores fuera
+        de [0, MAX_MINUTES) van en barras propias: [mínimo, 0) y [MAX_MINUTES, máximo].
+        """
+        hs = self.sets[(metric, by)]
+        counts = hs.counts.sum(axis=0)
+        w = hs.bin_width
+        desde, hasta, blocks = [], [], []
+        if counts[0]:
+            desde.append(float(hs.mins.min()))
+            hasta.append(0.0)
+            blocks.append(hs.counts[:, :1])
+        used = np.flatnonzero(counts[1:-1])
+        if len(used):
+            lo, hi = used[0], used[-1] + 1
+            step = max(1, int(np.ceil((hi - lo) / bins)))
+            edges = np.arange(lo, hi + step, step)
+            # Bins finos -> barras de `step` bins (la última, recortada al rango regular)
+            regular = hs.counts[:, 1:-1]
+            blocks.append(np.add.reduceat(regular[:, lo:], edges[:-1] - lo, axis=1))
+            desde.extend(edges[:-1] * w)
+            hasta.extend(np.minimum(edges[1:], hs.n_bins) * w)
+        if counts[-1]:
+            start = hs.n_bins * w
+            desde.append(start)
+            hasta.append(max(float(hs.maxs.max()), start + w))
+            blocks.append(hs.counts[:, -1:])
+        if not blocks:
+            return pd.DataFrame(columns=([by] if by else []) + ['Desde', 'Hasta', 'Conteo', 'Densidad'])
+
+        grouped = np.hstack(blocks)
+        desde, hasta = np.asarray(desde, dtype=float), np.asarray(hasta, dtype=float)
+        n = hs.totals()
+        frame = pd.DataFrame({
+            'Desde': np.tile(desde, len(hs.keys)),
+            'Hasta': np.tile(hasta, len(hs.keys)),
+            'Conteo': grouped.ravel(),
+            'Densidad': (grouped / np.maximum(n, 1)[:, None] / (hasta - desde)).ravel(),
+        })
+        if by:
+            frame.insert(0, by, np.repeat(np.asarray(hs.keys, dtype=object), len(desde)))
+        return frame
+
+    def quantiles(self, metric: str, by: Optional[str] = 'Sucursal',
+                  qs: Iterable[float] = QUANTILES) -> pd.DataFrame:
+        """Cuantiles y resumen por llave: [by, Conteo, Media, Min, Max, q...]."""
+        qs = list(qs)
+        hs = self.sets[(metric, by)]
+        n = hs.totals()
+        frame = pd.DataFrame({
+            'Conteo': n,
+            'Media': hs.sums / np.maximum(n, 1),
+            'Min': hs.mins,
+            'Max': hs.maxs,
+        })
+        values = hs.quantiles(qs)
+        for i, q in enumerate(qs):
+            frame[f'q{q:g}'] = values[:, i]
+        if by:
+            frame.insert(0, by, hs.keys)
+        return frame
+
+
+_CACHE = VersionCache(lambda df: VisitSketches().update(df), CACHE_SIZE)
+
+
+def get_sketches(version: Hashable, load: Callable[[], pd.DataFrame]) -> VisitSketches:
+    """Resúmenes de la versión de datos `version`; solo la primera vez se recorre `load()`."""
+    return _CACHE.get(version, load)
+
+
+def invalidate(table: str) -> None:
+    """Descarta las versiones guardadas de `table` (llaves (tabla, versión))."""
+    _CACHE.invalidate(table)
@@ -0,0 +1,127 @@
+"""
+SolverResults.py
+
+Soluciones del MILP exacto compartidas entre workers de gunicorn. Cada solución
+se guarda como JSON en un directorio común, así que la consulta de la UI
+(/proposal/exact) la encuentra aunque la atienda otro worker. Un archivo
+`.lock` creado de forma exclusiva marca la solución en curso: solo el proceso
+que lo crea lanza el MILP y los demás esperan el resultado.
+
+  SOLVER_RESULTS_DIR   directorio de los archivos (default <SHARED_DATASET_DIR>/solver)
+
+Las llaves deben ser iguales en todos los procesos (nombre y versión publicada
+de la tabla más los parámetros, no contadores locales como TableCache.version).
+Un resultado guardado con `ttl` (p. ej. un error) deja de valer al expirar y la
+siguiente consulta vuelve a resolverlo.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Hashable, Optional
+
+from SharedDataset import DEFAULT_DIR
+
+logger = logging.getLogger(__name__)
+
+# Soluciones que se conservan en el directorio (las más recientes)
+KEEP_RESULTS = 64
+
+
+class SolverResults:
+    """Resultados por llave en archivos JSON, con un lock por solución en curso."""
+
+    def __init__(self, directory: Optional[str] = None, stale_seconds: float = 300.0):
+        self.directory = directory or os.getenv(
+            "SOLVER_RESULTS_DIR",
+            os.path.join(os.getenv("SHARED_DATASET_DIR", DEFAULT_DIR), "solver"))
+        # Un lock más viejo que esto se considera de un proceso que murió
+        self.stale_seconds = stale_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    # ---------- Métodos privados ----------
+
+    def _path(self, key: Hashable, ext: str) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{ext}")
+
+    def _cleanup(self) -> None:
+        files = sorted(
+            (os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".json")),
+            key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0,
+        )
+        for path in files[:-KEEP_RESULTS]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ---------- API pública ----------
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        """Resultado guardado para `key`, o None si no existe o ya expiró."""
+        path = self._path(key, "json")
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if data.get("expires", float("inf")) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data
+
+    def claim(self, key: Hashable) -> bool:
+        """
+        Reserva `key` para este proceso. False si otro proceso ya la está resolviendo
+        (con un lock vigente); un lock viejo se reemplaza.
+        """
+        lock = self._path(key, "lock")
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    age = time.time() - os.stat(lock).st_mtime
+                except OSError:
+                    continue
+                if age < self.stale_seconds:
+                    return False
+                logger.warning("Lock de solución abandonado (%.0f s), se reemplaza: %s", age, lock)
+                try:
+                    os.remove(lock)
+                except OSError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as fh:
+                fh.write(str(os.getpid()))
+            return True
+        return False
+
+    def put(self, key: Hashable, data: dict, ttl: Optional[float] = None) -> None:
+        """
+        Guarda el resultado (escritura atómica) y libera el lock de `key`. Con `ttl`
+        el resultado expira a los `ttl` segundos.
+        """
+        path = self._path(key, "json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        if ttl is not None:
+            data = dict(data, expires=time.time() + ttl)
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, path)
+        finally:
+            self.release(key)
+        self._cleanup()
+
+    def release(self, key: Hashable) -> None:
+        try:
+            os.remove(self._path(key, "lock"))
+        except OSError:
+            pass
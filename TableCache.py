@@ -0,0 +1,139 @@
+"""
+TableCache.py
+
+Caché de tablas cargadas (DataFrames) con presupuesto de memoria y desalojo LRU
+por tamaño. Las tablas se cargan de forma perezosa en el primer acceso.
+
+  TABLE_CACHE_MB   presupuesto de memoria de la caché (default 1024)
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MB = 1024
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Tamaño en memoria del DataFrame, incluyendo el texto de columnas object."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class TableCache:
+    """Caché LRU de DataFrames acotada por bytes."""
+
+    def __init__(
+        self,
+        load: Callable[[str], pd.DataFrame],
+        budget_bytes: Optional[int] = None,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self._load = load
+        self._on_evict = on_evict
+        self.budget_bytes = budget_bytes if budget_bytes is not None else (
+            int(os.getenv("TABLE_CACHE_MB", DEFAULT_BUDGET_MB)) * 2**20)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # tabla -> (df, bytes)
+        self._lock = threading.Lock()
+        # Un lock por tabla para que requests concurrentes no la carguen dos veces
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # Versión de datos por tabla: cambia en cada `put`, sirve de llave a cachés derivadas
+        self._versions: Dict[str, int] = {}
+        self._next_version = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- Métodos privados ----------
+
+    def _evict(self, keep: str) -> None:
+        """Desaloja las tablas menos usadas hasta respetar el presupuesto (con el lock tomado)."""
+        total = sum(size for _, size in self._entries.values())
+        for table in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            if table == keep:
+                continue
+            _, size = self._entries.pop(table)
+            total -= size
+            logger.info("Tabla '%s' desalojada de la caché (%.1f MB)", table, size / 2**20)
+            if self._on_evict:
+                self._on_evict(table)
+        if total > self.budget_bytes:
+            logger.warning(
+                "La tabla '%s' (%.1f MB) excede el presupuesto de la caché (%.1f MB)",
+                keep, total / 2**20, self.budget_bytes / 2**20,
+            )
+
+    # ---------- API pública ----------
+
+    def get(self, table: str) -> pd.DataFrame:
+        """Devuelve la tabla, cargándola en el primer acceso."""
+        return self.get_versioned(table)[0]
+
+    def get_versioned(self, table: str) -> Tuple[pd.DataFrame, int]:
+        """
+        (tabla, versión) leídos juntos: la versión corresponde a ese DataFrame aunque
+        otro request lo desaloje o reemplace justo después (llave de cachés derivadas).
+        """
+        with self._lock:
+            entry = self._entries.get(table)
+            if entry is not None:
+                self._entries.move_to_end(table)
+                self.hits += 1
+                return entry[0], self._versions[table]
+            load_lock = self._load_locks.setdefault(table, threading.Lock())
+
+        with load_lock:
+            # Otro request pudo cargarla mientras esperábamos
+            with self._lock:
+                entry = self._entries.get(table)
+                if entry is not None:
+                    self._entries.move_to_end(table)
+                    self.hits += 1
+                    return entry[0], self._versions[table]
+                self.misses += 1
+            df = self._load(table)
+            return df, self.put(table, df)
+
+    def put(self, table: str, df: pd.DataFrame) -> int:
+        """Inserta o reemplaza una tabla, aplica el presupuesto y devuelve su versión."""
+        size = frame_bytes(df)
+        with self._lock:
+            self._entries[table] = (df, size)
+            self._next_version += 1
+            self._versions[table] = version = self._next_version
+            self._entries.move_to_end(table)
+            self._evict(keep=table)
+        return version
+
+    def invalidate(self, table: Optional[str] = None) -> None:
+        """Descarta una tabla (o todas) para que se recargue en el próximo acceso."""
+        with self._lock:
+            tables = [table] if table else list(self._entries)
+            for t in tables:
+                if self._entries.pop(t, None) is not None and self._on_evict:
+                    self._on_evict(t)
+
+    def version(self, table: str) -> Optional[int]:
+        """Versión de los datos en caché de la tabla (None si no está cargada)."""
+        with self._lock:
+            return self._versions.get(table) if table in self._entries else None
+
+    def __contains__(self, table: str) -> bool:
+        with self._lock:
+            return table in self._entries
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tables": {t: size for t, (_, size) in self._entries.items()},
+                "bytes": sum(size for _, size in self._entries.values()),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,41 @@
+"""
+VersionCache.py
+
+LRU en memoria de objetos derivados de una tabla (pronóstico, histogramas...)
+indexados por versión de datos: llaves (tabla, versión de TableCache.get_versioned). Solo
+la primera vez por versión se llama a `load()` y se construye el objeto.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+
+
+class VersionCache:
+    def __init__(self, build: Callable[[pd.DataFrame], Any], size: int = 8):
+        self.build = build
+        self.size = size
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version: Hashable, load: Callable[[], pd.DataFrame]) -> Any:
+        """Objeto de la versión `version`; se construye con `build(load())` si falta."""
+        with self._lock:
+            item = self._items.get(version)
+            if item is not None:
+                self._items.move_to_end(version)
+                return item
+        item = self.build(load())
+        with self._lock:
+            self._items[version] = item
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return item
+
+    def invalidate(self, table: str) -> None:
+        """Descarta las versiones guardadas de `table` (llaves (tabla, versión))."""
+        with self._lock:
+            for key in [k for k in self._items if isinstance(k, tuple) and k[0] == table]:
+                del self._items[key]
@@ -1,21 +1,46 @@
 # app.py
-from flask import Flask, render_template
-import pandas as pd
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, g, jsonify, Response
+import numpy as np
 from DataLoader import DataLoader
 from Analisis import (
+    preprocess_visits,
     plot_combined_panels,
     plot_histogram_density,
     plot_facet_histogram,
     plot_demand_heatmap,
     plot_avg_demand_line,
     plot_bar_avg_total_time,
-    plot_stacked_area_daily_counts
+    plot_stacked_area_daily_counts,
+    load_dashboard_aggregates
 )
-from Model import load_and_preprocess, build_figure
+from Model import build_figure, preprocess as preprocess_model
+import Forecast
+import Sketches
+from Queueing import evaluate as queue_evaluate, staffing_floor_frame
+from SolverResults import SolverResults
+from TableCache import TableCache
+from VersionCache import VersionCache
 from flask import request
 import plotly.io as pio
+import Metrics
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# AGGREGATION_PUSHDOWN=1: conteos y promedios se agregan en la base de datos
+PUSHDOWN = os.getenv("AGGREGATION_PUSHDOWN", "0") == "1"
+# SHARED_DATASET=1: un solo dataset en memoria compartida para todos los workers
+SHARED = os.getenv("SHARED_DATASET", "0") == "1"
+# Solver exacto de /proposal: tiempo límite (s) e hilos en segundo plano
+SOLVER_TIME_LIMIT = float(os.getenv("SOLVER_TIME_LIMIT", "10"))
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", "2"))
 
 loader = DataLoader()
 tables = loader.list_tables()
@@ -25,18 +50,106 @@ if not tables:
     app.logger.error("No hay tablas disponibles en la base de datos.")
     sys.exit(1)
 
+# Tabla por defecto; las demás se cargan al elegirlas con ?table=
 table = tables[0]
-df = loader.load_table(table).copy()
 
-# Preprocessing
-df['FechaDT'] = pd.to_datetime(df['Fecha'], format='%Y%m%d', errors='coerce')
-df['InicioEsperaDT'] = pd.to_datetime(df['Hora inicio de espera limpia'], errors='coerce')
-df['InicioAtencionDT'] = pd.to_datetime(df['Hora inicio de atencion'], errors='coerce')
+if SHARED:
+    from SharedDataset import SharedDataset
+# tabla -> SharedDataset (solo con SHARED_DATASET=1)
+shared = {}
+
+def load_visits(name):
+    # Se lee la versión publicada directamente, así un swap durante la carga no mezcla datos
+    version = loader.table_version(name)
+    def load():
+        # Preprocessing
+        return preprocess_visits(loader.load_table(version).copy())
+    if SHARED:
+        if name not in shared:
+            shared[name] = SharedDataset(name)
+        return shared[name].get_or_publish(load, source=version)
+    return load()
+
+def release_visits(name):
+    if name in shared:
+        shared[name].release()
+
+# Agregados de /plots con AGGREGATION_PUSHDOWN, por (tabla, versión publicada)
+dashboard_aggregates = VersionCache(lambda aggregates: aggregates)
+
+# Caché de tablas con presupuesto TABLE_CACHE_MB y desalojo LRU
+cache = TableCache(load_visits, on_evict=release_visits)
+cache.get(table)
+
+def selected_table():
+    """Tabla pedida con ?table= (o en el formulario), si existe; si no, la por defecto."""
+    name = request.values.get("table", table)
+    return name if name in tables else table
+
+def invalidate_table(name):
+    """Descarta la tabla y todo lo derivado de ella (pronósticos, histogramas, agregados, soluciones)."""
+    cache.invalidate(name)
+    Forecast.invalidate(name)
+    Sketches.invalidate(name)
+    dashboard_aggregates.invalidate(name)
+    with exact_lock:
+        for key in [k for k in exact_jobs if k[0] == name]:
+            del exact_jobs[key]
+
+def get_versioned_visits(name):
+    """(visitas, llave (tabla, versión) para las cachés derivadas de ese mismo DataFrame)."""
+    # Versión nueva publicada en la base (swap atómico): se recarga en este acceso
+    if loader.version_changed(name):
+        invalidate_table(name)
+    else:
+        # Con dataset compartido, cambia a la versión nueva si otro proceso la publicó
+        ds = shared.get(name)
+        if ds is not None and ds.refresh():
+            cache.put(name, ds.df)
+    df, version = cache.get_versioned(name)
+    return df, (name, version)
 
-df.dropna(subset=['InicioEsperaDT', 'InicioAtencionDT'], inplace=True)
+def get_visits(name):
+    return get_versioned_visits(name)[0]
 
-df['TotalTiempo'] = df['Minutos de espera'] + df['Minutos de atencion']
-df['DiaSemana'] = df['InicioEsperaDT'].dt.day_name()
+def to_html(name, fig, **kwargs):
+    """Serializa una figura a HTML midiendo tiempo y bytes."""
+    with Metrics.stage("to_html", plot=name) as st:
+        html = pio.to_html(fig, full_html=False, **kwargs)
+        st.bytes = len(html)
+    return html
+
+# ---------- Instrumentación por request ----------
+@app.before_request
+def start_request_timer():
+    g.request_t0 = time.perf_counter()
+    g.profile = request.args.get("profile") == "1"
+    if g.profile:
+        Metrics.start_profile()
+
+@app.after_request
+def record_request(response):
+    if request.endpoint == "metrics" or not hasattr(g, "request_t0"):
+        return response
+    st = Metrics.Stage("http_request", {"endpoint": request.endpoint or "none"})
+    st.seconds = time.perf_counter() - g.request_t0
+    st.bytes = response.calculate_content_length()
+    if Metrics.ENABLED:
+        Metrics.record(st)
+    if g.profile:
+        # ?profile=1 devuelve el desglose por etapa en lugar de la página
+        return jsonify({
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "total_seconds": round(st.seconds, 6),
+            "response_bytes": st.bytes,
+            "stages": Metrics.stop_profile(),
+        })
+    return response
+
+@app.route("/metrics")
+def metrics():
+    return Response(Metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def home():
@@ -44,42 +157,248 @@ def home():
 
 @app.route("/plots")
 def render_all_plots():
+    name = selected_table()
+    df, version = get_versioned_visits(name)
+    # Histogramas y cuantiles calculados una vez por versión de la tabla en caché
+    sketches = Sketches.get_sketches(version, lambda: df)
     plots = {
-        "combined_panels": plot_combined_panels(df, ['Minutos de espera', 'Minutos de atencion', 'TotalTiempo']).to_html(full_html=False),
-        "histogram_density": plot_histogram_density(df, 'TotalTiempo', 'Densidad de Tiempo Total').to_html(full_html=False),
-        "facet_histogram": plot_facet_histogram(df, 'Minutos de espera', 'DiaSemana', 'Espera por Día de Semana').to_html(full_html=False),
-        "heatmap": plot_demand_heatmap(df, 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal').to_html(full_html=False),
-        "avg_demand_line": plot_avg_demand_line(df, 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal').to_html(full_html=False),
-        "bar_avg_total_time": plot_bar_avg_total_time(df).to_html(full_html=False),
-        "stacked_area": plot_stacked_area_daily_counts(df).to_html(full_html=False)
+        "combined_panels": to_html("combined_panels", plot_combined_panels(df, ['Minutos de espera', 'Minutos de atencion', 'TotalTiempo'], quantiles=sketches.quantiles('TotalTiempo', by='Sucursal'))),
+        "histogram_density": to_html("histogram_density", plot_histogram_density(sketches.histogram('TotalTiempo', bins=40), 'TotalTiempo', 'Densidad de Tiempo Total', pre_aggregated=True)),
+        "facet_histogram": to_html("facet_histogram", plot_facet_histogram(sketches.histogram('Minutos de espera', by='DiaSemana'), 'Minutos de espera', 'DiaSemana', 'Espera por Día de Semana', pre_aggregated=True)),
     }
-    return render_template("plots.html", plots=plots)
+    if PUSHDOWN:
+        # Una vez por versión publicada; se consulta la tabla de esa versión directamente
+        source = loader.known_version(name)
+        agg = dashboard_aggregates.get((name, source), lambda: load_dashboard_aggregates(loader, source))
+        plots.update({
+            "heatmap": to_html("heatmap", plot_demand_heatmap(agg["hourly"], 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal', pre_aggregated=True)),
+            "avg_demand_line": to_html("avg_demand_line", plot_avg_demand_line(agg["hourly"], 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal', pre_aggregated=True)),
+            "bar_avg_total_time": to_html("bar_avg_total_time", plot_bar_avg_total_time(agg["avg_total"], pre_aggregated=True)),
+            "stacked_area": to_html("stacked_area", plot_stacked_area_daily_counts(agg["daily"], pre_aggregated=True))
+        })
+    else:
+        plots.update({
+            "heatmap": to_html("heatmap", plot_demand_heatmap(df, 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal')),
+            "avg_demand_line": to_html("avg_demand_line", plot_avg_demand_line(df, 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal')),
+            "bar_avg_total_time": to_html("bar_avg_total_time", plot_bar_avg_total_time(df)),
+            "stacked_area": to_html("stacked_area", plot_stacked_area_daily_counts(df))
+        })
+    return render_template("plots.html", plots=plots, tables=tables, table=name)
 
-@app.route('/proposal', methods=['GET', 'POST'])
-def proposal():
-    # Valores por defecto
-    t_cost_full = 150.0
-    t_cost_part = 90.0
-    t_capacity = 10
+def demand_inputs(name, t_demand, t_horizon):
+    """
+    Llegadas por sucursal x hora (media histórica o pronóstico), día objetivo y
+    minutos promedio de atención por sucursal, desde las cachés por versión.
+    """
+    df, version = get_versioned_visits(name)
+    # Parámetros ajustados una vez por versión de la tabla en caché
+    forecast = Forecast.get_forecast(version, lambda: preprocess_model(df))
+    service = Sketches.get_sketches(version, lambda: df).quantiles('Minutos de atencion', by='Sucursal')
+    service_minutes = service.set_index('Sucursal')['Media']
+
+    if t_demand == 'forecast':
+        return (forecast.demand_frame(t_horizon),
+                forecast.target_day(t_horizon).strftime('%Y-%m-%d'),
+                service_minutes)
+    return forecast.historical_frame(), None, service_minutes
+
+def demand_params():
+    t_demand = request.values.get('t_demand', 'historical')
+    t_horizon = min(max(int(request.values.get('t_horizon', 1)), 1), 28)
+    return t_demand, t_horizon
+
+def proposal_params():
+    """Parámetros del formulario de /proposal (POST) o de la consulta (GET)."""
+    t_demand, t_horizon = demand_params()
+    return dict(
+        t_cost_full=float(request.values.get('t_cost_full', 150.0)),
+        t_cost_part=float(request.values.get('t_cost_part', 90.0)),
+        t_capacity=int(request.values.get('t_capacity', 10)),
+        # Demanda a cubrir: media histórica o pronóstico a `t_horizon` días
+        t_demand=t_demand,
+        t_horizon=t_horizon,
+        # % de pacientes que debe esperar menos de 20 min (0 = sin piso de cola)
+        t_service_level=min(max(float(request.values.get('t_service_level', 0)), 0), 99),
+        # auto: heurística inmediata y MILP exacto en segundo plano
+        t_solver=request.values.get('t_solver', 'auto'),
+    )
 
-    if request.method == 'POST':
-        t_cost_full = float(request.form.get('t_cost_full', 150.0))
-        t_cost_part = float(request.form.get('t_cost_part', 90.0))
-        t_capacity = int(request.form.get('t_capacity', 10))
+def solve_proposal(name, params, solver):
+    """Figura de la propuesta y resumen del solver (método, costo total y brecha máxima)."""
+    demand, target_day, service_minutes = demand_inputs(name, params['t_demand'], params['t_horizon'])
+    # Piso de empleados por hora según el modelo de colas
+    min_staff = None
+    if params['t_service_level'] > 0:
+        min_staff = staffing_floor_frame(demand, service_minutes, params['t_service_level'] / 100)
 
+    info = {}
+    fig = build_figure(None, params['t_cost_full'], params['t_cost_part'], params['t_capacity'],
+                       demand=demand, min_staff=min_staff, solver=solver,
+                       time_limit=SOLVER_TIME_LIMIT if solver == 'exact' else None, info=info)
+    methods = {i['method'] for i in info.values()}
+    summary = {
+        "method": next((m for m in ('heuristic', 'time_limit') if m in methods), 'exact'),
+        "cost": sum(i['cost'] for i in info.values()),
+        "gap": max((i['gap'] for i in info.values()), default=0.0),
+    }
+    return fig, summary, list(demand.index), target_day
+
+# Soluciones exactas por parámetros. Las llaves usan la versión publicada de la tabla
+# (igual en todos los workers): el MILP se lanza en un solo proceso y el resultado
+# queda en SolverResults, donde lo encuentra la consulta aunque llegue a otro worker.
+solver_pool = ThreadPoolExecutor(max_workers=SOLVER_WORKERS)
+exact_jobs = OrderedDict()   # llave -> Future local de los MILP lanzados por este proceso
+exact_lock = threading.Lock()
+EXACT_CACHE_SIZE = 32
+# Un MILP que falló se reporta a los workers que lo consultan durante este tiempo (s)
+# y después se vuelve a intentar; un error nunca queda guardado para siempre.
+EXACT_ERROR_TTL = 30.0
+exact_results = SolverResults(stale_seconds=max(300.0, 20 * SOLVER_TIME_LIMIT))
+
+def exact_key(name, params):
+    # Carga la tabla (y detecta versiones nuevas) antes de fijar la versión de la llave
+    get_visits(name)
+    return (name, loader.known_version(name)) + tuple(
+        sorted((k, v) for k, v in params.items() if k != 't_solver'))
+
+class ExactSolveError(Exception):
+    """El MILP exacto en segundo plano falló (aquí o en otro worker)."""
+
+def solve_exact(key, name, params):
+    """MILP exacto; el resultado se comparte con los demás workers (un error, por poco tiempo)."""
+    try:
+        fig, summary, branches, target_day = solve_proposal(name, params, 'exact')
+    except Exception as e:
+        exact_results.put(key, {"error": str(e)}, ttl=EXACT_ERROR_TTL)
+        raise
+    exact_results.put(key, {"figure": fig.to_json(), "summary": summary,
+                            "branches": branches, "target_day": target_day})
+    return fig, summary, branches, target_day
+
+def stored_exact(data):
+    if "error" in data:
+        raise ExactSolveError(data["error"])
+    return pio.from_json(data["figure"]), data["summary"], data["branches"], data["target_day"]
+
+def exact_result(name, params, wait=False):
+    """
+    (figura, resumen, sucursales, día) del MILP exacto, o None si aún no termina.
+    Lo lanza el primer proceso que lo pide; con wait=True se espera el resultado.
+    Si el MILP falla se lanza ExactSolveError.
+    """
+    key = exact_key(name, params)
+    while True:
+        with exact_lock:
+            job = exact_jobs.get(key)
+            if job is not None:
+                exact_jobs.move_to_end(key)
+        if job is not None:
+            if not (wait or job.done()):
+                return None
+            try:
+                return job.result()
+            except Exception as e:
+                logger.exception("Falló el MILP exacto de %s", name)
+                # Sin el Future local, la siguiente consulta lee el error (o reintenta al expirar)
+                with exact_lock:
+                    if exact_jobs.get(key) is job:
+                        del exact_jobs[key]
+                raise ExactSolveError(str(e)) from e
+        data = exact_results.get(key)
+        if data is not None:
+            return stored_exact(data)
+        if exact_results.claim(key):
+            with exact_lock:
+                exact_jobs[key] = solver_pool.submit(solve_exact, key, name, params)
+                while len(exact_jobs) > EXACT_CACHE_SIZE:
+                    exact_jobs.popitem(last=False)
+            continue
+        if not wait:
+            return None
+        # Otro worker lo está resolviendo
+        time.sleep(0.2)
+
+@app.route('/proposal', methods=['GET', 'POST'])
+def proposal():
+    params = proposal_params()
+    name = selected_table()
     try:
-        df_model = load_and_preprocess()
-    except ValueError as e:
+        if params['t_solver'] == 'fast':
+            fig, summary, branches, target_day = solve_proposal(name, params, 'fast')
+        else:
+            try:
+                result = exact_result(name, params, wait=params['t_solver'] == 'exact')
+                error = None
+            except ExactSolveError as e:
+                result, error = None, f"falló la solución exacta: {e}"
+            if result is None:
+                # La heurística se muestra ya; la página pide la exacta a /proposal/exact
+                result = solve_proposal(name, params, 'fast')
+            fig, summary, branches, target_day = result
+            if error:
+                summary = dict(summary, error=error)
+    except (ValueError, KeyError, IndexError) as e:
         return f"<h2>Error en la carga de datos: {str(e)}</h2>", 500
 
-    fig = build_figure(df_model, t_cost_full, t_cost_part, t_capacity)
-    plot_html = pio.to_html(fig, full_html=False)
+    plot_html = to_html("proposal", fig, div_id="proposal-plot")
 
     return render_template('proposal.html',
                            plot_html=plot_html,
-                           t_cost_full=t_cost_full,
-                           t_cost_part=t_cost_part,
-                           t_capacity=t_capacity)
+                           tables=tables,
+                           table=name,
+                           branches=branches,
+                           target_day=target_day,
+                           solver=summary,
+                           **params)
+
+@app.route('/proposal/exact')
+def proposal_exact():
+    """Solución exacta para los parámetros de la consulta, si ya terminó (la UI la consulta)."""
+    params = proposal_params()
+    try:
+        result = exact_result(selected_table(), params)
+    except ExactSolveError as e:
+        return jsonify({"ready": True, "error": f"falló la solución exacta: {e}"})
+    except (ValueError, KeyError, IndexError) as e:
+        return jsonify({"ready": True, "error": str(e)}), 500
+    if result is None:
+        return jsonify({"ready": False})
+    fig, summary, _, _ = result
+    with Metrics.stage("to_json", plot="proposal") as st:
+        figure = fig.to_json()
+        st.bytes = len(figure)
+    return Response(f'{{"ready": true, "summary": {json.dumps(summary)}, "figure": {figure}}}',
+                    mimetype="application/json")
+
+@app.route('/api/queue')
+def queue_api():
+    """Espera esperada y P(espera > 20 min) por hora y número de empleados de una sucursal."""
+    name = selected_table()
+    t_demand, t_horizon = demand_params()
+    try:
+        demand, target_day, service_minutes = demand_inputs(name, t_demand, t_horizon)
+    except (ValueError, KeyError, IndexError) as e:
+        return jsonify({"error": str(e)}), 500
+    branch = request.args.get("branch", demand.index[0])
+    if branch not in demand.index:
+        return jsonify({"error": f"Sucursal desconocida: {branch}"}), 404
+
+    arrivals = demand.loc[[branch]]
+    service = float(service_minutes.get(branch, service_minutes.mean()))
+    wait, p_over, levels = queue_evaluate(arrivals.to_numpy(), np.array([service]))
+    # JSON no admite inf: colas inestables se envían como null
+    wait_minutes = [[round(float(w), 2) if np.isfinite(w) else None for w in row] for row in wait[0]]
+    return jsonify({
+        "table": name,
+        "branch": branch,
+        "target_day": target_day,
+        "hours": [int(h) for h in arrivals.columns],
+        "levels": levels.tolist(),
+        "arrivals": np.round(arrivals.to_numpy()[0], 3).tolist(),
+        "service_minutes": round(service, 3),
+        "wait_minutes": wait_minutes,
+        "p_wait_over_20": np.round(p_over[0], 4).tolist(),
+    })
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# run_benchmarks.py — Mide tiempos y memoria de los caminos de datos de punta a punta
+# (carga, gráficas de Analisis, optimizador de Model e ingesta de upload_to_sql)
+# sobre datos sintéticos en una base local, y guarda los resultados en JSON.
+#
+# Uso:
+#   python benchmarks/run_benchmarks.py                         # tamaños chicos
+#   python benchmarks/run_benchmarks.py --tamanos 10000000x200  # 10M filas, 200 sucursales
+#   python benchmarks/run_benchmarks.py --comparar benchmarks/results/antes.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "utils"))
+
+import numpy as np
+import pandas as pd
+
+import Analisis
+import Forecast
+import Model
+import Queueing
+import Sketches
+from Backends import make_backend
+from DataLoader import DataLoader
+from synthetic_data import escribir_visitas, generar_visitas
+
+# ===== CONFIGURACIÓN =====
+TAMANOS_DEFAULT = ["10000x5", "100000x20", "1000000x50"]
+TAMANOS_COMPLETOS = TAMANOS_DEFAULT + ["10000000x200"]
+# Granularidades de turno (horas full-time, horas part-time)
+TURNOS = [(8, 4), (6, 3), (4, 2)]
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+TABLA = "Datos_Benchmark_con_sentido"
+
+
+def _rss_mb() -> float:
+    """RSS pico del proceso en MB (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def rss_pico_mb(fn, setup=None):
+    """
+    Crecimiento del RSS pico al ejecutar `fn(*setup())` en un proceso hijo (fork).
+    A diferencia de tracemalloc incluye la memoria nativa (Arrow, DuckDB, SQLite).
+    Devuelve None si el sistema no tiene fork/resource.
+    """
+    if resource is None or not hasattr(os, "fork"):
+        return None
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(lectura)
+        try:
+            args = setup() if setup else ()
+            base = _rss_mb()
+            fn(*args)
+            os.write(escritura, str(max(_rss_mb() - base, 0.0)).encode())
+        finally:
+            os._exit(0)
+    os.close(escritura)
+    with os.fdopen(lectura) as fh:
+        salida = fh.read()
+    os.waitpid(pid, 0)
+    return round(float(salida), 2) if salida else None
+
+
+def medir(nombre, fn, repeticiones=1, memoria=True, setup=None):
+    """
+    Ejecuta `fn(*setup())` y devuelve {etapa, segundos, pico_mb, rss_pico_mb, ...}.
+    El tiempo se mide sin tracemalloc; la memoria pico en corridas aparte: pico_mb
+    (tracemalloc, solo memoria de Python) y rss_pico_mb (RSS del proceso en un hijo).
+    """
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        args = setup() if setup else ()
+        t0 = time.perf_counter()
+        resultado = fn(*args)
+        tiempos.append(time.perf_counter() - t0)
+
+    fila = {"etapa": nombre, "segundos": min(tiempos), "segundos_media": float(np.mean(tiempos))}
+    if memoria:
+        args = setup() if setup else ()
+        tracemalloc.start()
+        fn(*args)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        fila["pico_mb"] = round(pico / 2**20, 2)
+        fila["rss_pico_mb"] = rss_pico_mb(fn, setup)
+    print(f"   {nombre:<45} {fila['segundos']:>9.3f} s   {fila.get('pico_mb', '-'):>9} MB"
+          f"   {fila.get('rss_pico_mb', '-'):>9} MB RSS")
+    return fila, resultado
+
+
+def bench_carga(loader, **kw):
+    res = []
+    res.append(medir("load_table", lambda: loader.load_table(TABLA), **kw))
+    res.append(medir("load_table nrows=1000", lambda: loader.load_table(TABLA, nrows=1000), **kw))
+    res.append(medir("load_table sample_frac=0.1", lambda: loader.load_table(TABLA, sample_frac=0.1), **kw))
+    res.append(medir("load_dashboard_aggregates", lambda: Analisis.load_dashboard_aggregates(loader, TABLA), **kw))
+    fila, df = res[0]
+    fila["filas"] = len(df)
+    fila["bytes_df"] = int(df.memory_usage(deep=True).sum())
+    return [r[0] for r in res], df
+
+
+def bench_graficas(df_base, **kw):
+    """Cada plot_* de Analisis: tiempo de cálculo y de to_html, y tamaño del HTML."""
+    graficas = {
+        "plot_combined_panels": lambda d: Analisis.plot_combined_panels(
+            d, ['Minutos de espera', 'Minutos de atencion', 'TotalTiempo']),
+        "plot_histogram_density": lambda d: Analisis.plot_histogram_density(
+            d, 'TotalTiempo', 'Densidad de Tiempo Total'),
+        "plot_facet_histogram": lambda d: Analisis.plot_facet_histogram(
+            d, 'Minutos de espera', 'DiaSemana', 'Espera por Día de Semana'),
+        "plot_demand_heatmap": lambda d: Analisis.plot_demand_heatmap(
+            d, 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal'),
+        "plot_avg_demand_line": lambda d: Analisis.plot_avg_demand_line(
+            d, 'InicioEsperaDT', 'Sucursal', 'Demanda Promedio por Hora y Sucursal'),
+        "plot_bar_avg_total_time": Analisis.plot_bar_avg_total_time,
+        "plot_stacked_area_daily_counts": Analisis.plot_stacked_area_daily_counts,
+    }
+    filas = []
+    # Las funciones de Analisis modifican el DataFrame; cada corrida usa una copia
+    setup = lambda: (df_base.copy(),)
+    for nombre, fn in graficas.items():
+        fila, fig = medir(nombre, fn, setup=setup, **kw)
+        filas.append(fila)
+        fila_html, html = medir(f"{nombre}.to_html", lambda: fig.to_html(full_html=False), **kw)
+        fila_html["bytes_html"] = len(html.encode())
+        filas.append(fila_html)
+
+    # Vistas de distribución desde histogramas pre-binneados
+    fila, sketches = medir("VisitSketches.update", lambda: Sketches.VisitSketches().update(df_base), **kw)
+    filas.append(fila)
+    prebinned = {
+        "plot_histogram_density pre-binneado": lambda: Analisis.plot_histogram_density(
+            sketches.histogram('TotalTiempo'), 'TotalTiempo', 'Densidad de Tiempo Total', pre_aggregated=True),
+        "plot_facet_histogram pre-binneado": lambda: Analisis.plot_facet_histogram(
+            sketches.histogram('Minutos de espera', by='DiaSemana'), 'Minutos de espera', 'DiaSemana',
+            'Espera por Día de Semana', pre_aggregated=True),
+    }
+    for nombre, fn in prebinned.items():
+        fila, fig = medir(nombre, fn, **kw)
+        filas.append(fila)
+        fila_html, html = medir(f"{nombre}.to_html", lambda: fig.to_html(full_html=False), **kw)
+        fila_html["bytes_html"] = len(html.encode())
+        filas.append(fila_html)
+    return filas
+
+
+def bench_modelo(**kw):
+    filas = []
+    fila, df_model = medir("Model.load_and_preprocess", Model.load_and_preprocess, **kw)
+    filas.append(fila)
+    filas.append(medir("Model.historical_demand", lambda: Model.historical_demand(df_model), **kw)[0])
+    fila, forecast = medir("Forecast.fit", lambda: Forecast.fit(df_model), **kw)
+    filas.append(fila)
+    filas.append(medir("Forecast.predict 28 días", lambda: forecast.predict(28), **kw)[0])
+    servicio = np.full(len(forecast.branches), 15.0)
+    filas.append(medir("Queueing.evaluate", lambda: Queueing.evaluate(forecast.historical, servicio), **kw)[0])
+
+    # optimize_staff aislado sobre la demanda de la primera sucursal
+    branch = sorted(df_model['SUCURSAL'].unique())[0]
+    ndf = df_model[df_model['SUCURSAL'] == branch]
+    demand = (ndf.groupby([ndf['FECHA'].dt.date, 'HORA']).size()
+              .groupby('HORA').mean().reindex(range(6, 20), fill_value=0))
+
+    for full_h, part_h in TURNOS:
+        full_shifts = {f'FT_{h}': list(range(h, h + full_h)) for h in range(6, 21 - full_h)}
+        part_shifts = {f'PT_{h}': list(range(h, h + part_h)) for h in range(6, 21 - part_h)}
+        fila, _ = medir(
+            f"optimize_staff turnos={full_h}h/{part_h}h",
+            lambda: Model.optimize_staff(demand, full_shifts, part_shifts, 150.0, 90.0, 10), **kw)
+        filas.append(fila)
+        fila, _ = medir(
+            f"optimize_staff fast turnos={full_h}h/{part_h}h",
+            lambda: Model.optimize_staff(demand, full_shifts, part_shifts, 150.0, 90.0, 10, mode='fast'), **kw)
+        filas.append(fila)
+        fila, fig = medir(
+            f"build_figure turnos={full_h}h/{part_h}h",
+            lambda: Model.build_figure(df_model, 150.0, 90.0, 10, full_hours=full_h, part_hours=part_h), **kw)
+        filas.append(fila)
+        fila, html = medir(f"build_figure.to_html turnos={full_h}h/{part_h}h",
+                           lambda: fig.to_html(full_html=False), **kw)
+        fila["bytes_html"] = len(html.encode())
+        filas.append(fila)
+    return filas
+
+
+def bench_ingesta(backend, filas, sucursales, **kw):
+    """Ingesta vía upload_to_sql.subir_tabla sobre el backend local."""
+    import upload_to_sql
+
+    upload_to_sql._backend = backend
+    df = generar_visitas(min(filas, 1_000_000), sucursales)
+    fila, _ = medir("upload_to_sql.subir_tabla", lambda: upload_to_sql.subir_tabla("Ingesta_Benchmark", df), **kw)
+    fila["filas"] = len(df)
+    fila["filas_por_s"] = round(len(df) / fila["segundos"], 1)
+    return [fila]
+
+
+def correr_tamano(filas, sucursales, args):
+    print(f"\n➡️ {filas:,} filas × {sucursales} sucursales ({args.backend})")
+    kw = dict(repeticiones=args.repeticiones, memoria=not args.sin_memoria)
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, f"bench.{args.backend}")
+        os.environ["DATA_BACKEND"] = args.backend
+        os.environ["DATA_LOCAL_PATH"] = ruta
+        backend = make_backend(args.backend, local_path=ruta)
+
+        t0 = time.perf_counter()
+        escribir_visitas(backend, TABLA, filas, sucursales)
+        print(f"   datos sintéticos generados en {time.perf_counter() - t0:.1f} s")
+
+        loader = DataLoader(backend=backend)
+        etapas, df = bench_carga(loader, **kw)
+        if "graficas" not in args.omitir:
+            df = Analisis.preprocess_visits(df)
+            etapas += bench_graficas(df, **kw)
+        del df
+        if "modelo" not in args.omitir:
+            etapas += bench_modelo(**kw)
+        if "ingesta" not in args.omitir:
+            etapas += bench_ingesta(backend, filas, sucursales, **kw)
+
+    return {"filas": filas, "sucursales": sucursales, "etapas": etapas}
+
+
+def metadatos(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "backend": args.backend,
+        "repeticiones": args.repeticiones,
+    }
+
+
+def comparar(actual, ruta_base):
+    """Imprime la razón actual/base de segundos y memoria por etapa."""
+    with open(ruta_base) as fh:
+        base = json.load(fh)
+    indice = {(r["filas"], r["sucursales"], e["etapa"]): e
+              for r in base["resultados"] for e in r["etapas"]}
+    print(f"\n📊 Comparación contra {ruta_base} (commit {base['meta'].get('commit')})")
+    for r in actual["resultados"]:
+        for e in r["etapas"]:
+            b = indice.get((r["filas"], r["sucursales"], e["etapa"]))
+            if not b:
+                continue
+            ratio_t = e["segundos"] / b["segundos"] if b["segundos"] else float("nan")
+            linea = f"   {r['filas']:>10,}x{r['sucursales']:<4} {e['etapa']:<45} x{ratio_t:6.2f}"
+            if "pico_mb" in e and b.get("pico_mb"):
+                linea += f"   mem x{e['pico_mb'] / b['pico_mb']:6.2f}"
+            if e.get("rss_pico_mb") and b.get("rss_pico_mb"):
+                linea += f"   rss x{e['rss_pico_mb'] / b['rss_pico_mb']:6.2f}"
+            print(linea)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de punta a punta de SaludDigna.")
+    parser.add_argument("--tamanos", default=",".join(TAMANOS_DEFAULT),
+                        help="lista FILASxSUCURSALES separada por comas, o 'completo'")
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "duckdb"])
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--sin-memoria", action="store_true", help="no mide memoria pico")
+    parser.add_argument("--omitir", default="", help="etapas a omitir: graficas,modelo,ingesta")
+    parser.add_argument("--salida", default=None, help="archivo JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida previa")
+    args = parser.parse_args()
+
+    tamanos = TAMANOS_COMPLETOS if args.tamanos == "completo" else args.tamanos.split(",")
+    resultados = []
+    for t in tamanos:
+        filas, sucursales = (int(x) for x in t.lower().split("x"))
+        resultados.append(correr_tamano(filas, sucursales, args))
+
+    salida = {"meta": metadatos(args), "resultados": resultados}
+    ruta = args.salida or os.path.join(
+        RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, "w") as fh:
+        json.dump(salida, fh, indent=2)
+    print(f"\n✅ Resultados guardados en {ruta}")
+
+    if args.comparar:
+        comparar(salida, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
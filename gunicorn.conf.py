@@ -0,0 +1,41 @@
+# gunicorn.conf.py — Configuración para producción.
+#
+# Con SHARED_DATASET=1 y preload_app el master carga y publica el dataset una
+# sola vez antes de crear los workers; cada worker lo adjunta desde memoria
+# compartida en lugar de tener su propia copia.
+#
+# METRICS_DIR (por defecto un directorio temporal por master) permite que
+# /metrics sume las métricas de todos los workers en lugar de solo las del
+# worker que atiende el scrape.
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+# Se fija antes de cargar la app para que master y workers lo hereden
+_METRICS_DIR_DEFAULT = os.path.join(tempfile.gettempdir(), f"saluddigna_metrics_{os.getpid()}")
+os.environ.setdefault("METRICS_DIR", _METRICS_DIR_DEFAULT)
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("SHARED_DATASET", "0") == "1"
+wsgi_app = "app:app"
+
+
+def post_fork(server, worker):
+    # Con preload_app el worker hereda el pool de SQLAlchemy del master; sin esto dos
+    # workers podrían usar el mismo socket de pyodbc a la vez y corromper el flujo TDS.
+    # close=False: las conexiones heredadas se olvidan sin cerrarlas (son del master).
+    app_module = sys.modules.get("app")
+    engine = getattr(getattr(app_module, "loader", None), "engine", None)
+    if engine is not None:
+        engine.dispose(close=False)
+
+
+def on_exit(server):
+    # Solo se borra el directorio temporal propio, no uno configurado por el usuario
+    if os.environ.get("METRICS_DIR") == _METRICS_DIR_DEFAULT:
+        shutil.rmtree(_METRICS_DIR_DEFAULT, ignore_errors=True)
@@ -0,0 +1,36 @@
+import pandas as pd
+
+import Metrics
+from Sketches import VisitSketches
+
+
+def _stats(name):
+    return {labels: agg for (stage, labels), agg in Metrics._STATS.items() if stage == name}
+
+
+def test_timed_method_describes_dataframe_argument():
+    Metrics.reset()
+    df = pd.DataFrame({
+        "Sucursal": ["A", "A", "B"],
+        "DiaSemana": ["Monday"] * 3,
+        "InicioEsperaDT": pd.to_datetime(["2024-01-01 08:00"] * 3),
+        "Minutos de espera": [5.0, 10.0, None],
+        "Minutos de atencion": [3.0, 4.0, 6.0],
+        "TotalTiempo": [8.0, 14.0, None],
+    })
+    VisitSketches().update(df)
+    agg = _stats("sketch_update")[()]
+    assert agg["count"] == 1
+    assert agg["rows"] == 3
+    assert agg["bytes"] == int(df.memory_usage(index=False, deep=False).sum())
+
+
+def test_timed_function_falls_back_to_result():
+    Metrics.reset()
+
+    @Metrics.timed("build")
+    def build(n):
+        return pd.DataFrame({"x": range(n)})
+
+    build(4)
+    assert _stats("build")[()]["rows"] == 4
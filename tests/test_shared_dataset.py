@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from SharedDataset import SharedDataset
+
+
+def _frame(n=1000):
+    i = np.arange(n)
+    return pd.DataFrame({
+        "Minutos de espera": np.where(i % 7 == 0, np.nan, i * 0.5),
+        "FechaDT": pd.Series(pd.to_datetime("2024-01-01") + pd.to_timedelta(i, unit="h")).where(i % 5 != 0),
+        "Sucursal": pd.Series(np.where(i % 2 == 0, "A", "B")).where(i % 11 != 0),
+        "Conteo": i,
+    })
+
+
+def _mapped_ranges(path):
+    """Rangos de direcciones donde el proceso tiene mapeado `path` (Linux)."""
+    ranges = []
+    with open("/proc/self/maps") as fh:
+        for line in fh:
+            if line.rstrip().endswith(path):
+                start, end = line.split()[0].split("-")
+                ranges.append((int(start, 16), int(end, 16)))
+    return ranges
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="requiere /proc (Linux)")
+def test_map_is_zero_copy_with_nan_and_nat(tmp_path):
+    df = _frame()
+    assert df["Minutos de espera"].isna().any() and df["FechaDT"].isna().any()
+    ds = SharedDataset("visitas", directory=str(tmp_path))
+    ds.publish(df)
+
+    reader = SharedDataset("visitas", directory=str(tmp_path))
+    assert reader.refresh()
+    out = reader.df
+    with open(os.path.join(str(tmp_path), "visitas.current")) as fh:
+        ranges = _mapped_ranges(json.load(fh)["path"])
+    assert ranges
+    for col in ("Minutos de espera", "FechaDT", "Conteo"):
+        values = out[col].to_numpy()
+        # Vistas de solo lectura sobre el archivo mapeado, no copias privadas
+        assert not values.flags.writeable, col
+        assert values.base is not None, col
+        addr = values.__array_interface__["data"][0]
+        assert any(lo <= addr and addr + values.nbytes <= hi for lo, hi in ranges), col
+
+
+def test_round_trip_keeps_missing_values(tmp_path):
+    df = _frame()
+    ds = SharedDataset("visitas", directory=str(tmp_path))
+    ds.publish(df)
+    ds.refresh()
+    out = ds.df
+    assert out["FechaDT"].dtype == "datetime64[ns]"
+    pd.testing.assert_series_equal(out["Minutos de espera"], df["Minutos de espera"])
+    pd.testing.assert_series_equal(out["FechaDT"], df["FechaDT"].astype("datetime64[ns]"))
+    assert out["Sucursal"].isna().sum() == df["Sucursal"].isna().sum()
+    assert out["Conteo"].tolist() == df["Conteo"].tolist()
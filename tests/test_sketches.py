@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from Sketches import MAX_MINUTES, VisitSketches
+
+
+def _visits(values):
+    n = len(values)
+    return pd.DataFrame({
+        "Sucursal": ["A"] * n,
+        "DiaSemana": ["Monday"] * n,
+        "InicioEsperaDT": pd.to_datetime(["2024-01-01 08:00"] * n),
+        "Minutos de espera": values,
+        "Minutos de atencion": values,
+        "TotalTiempo": values,
+    })
+
+
+def test_out_of_range_values_get_their_own_bars():
+    values = [-3.0, 1.5, 2.5, 10.0, MAX_MINUTES + 30.0]
+    hist = VisitSketches().update(_visits(values)).histogram("TotalTiempo", bins=5)
+    assert hist["Conteo"].sum() == len(values)
+    first, last = hist.iloc[0], hist.iloc[-1]
+    assert (first["Desde"], first["Hasta"], first["Conteo"]) == (-3.0, 0.0, 1)
+    assert (last["Desde"], last["Hasta"], last["Conteo"]) == (MAX_MINUTES, MAX_MINUTES + 30.0, 1)
+    regular = hist.iloc[1:-1]
+    assert regular["Desde"].min() >= 0 and regular["Hasta"].max() <= MAX_MINUTES
+    # Cada valor cae dentro de la barra que lo cuenta
+    for v in values:
+        row = hist[(hist["Desde"] <= v) & ((v < hist["Hasta"]) | (hist["Hasta"] == hist["Hasta"].max()))]
+        assert row["Conteo"].sum() >= 1
+    area = (hist["Densidad"] * (hist["Hasta"] - hist["Desde"])).sum()
+    assert np.isclose(area, 1.0)
+
+
+def test_only_out_of_range_values_are_not_dropped():
+    hist = VisitSketches().update(_visits([-1.0, MAX_MINUTES + 5.0])).histogram("TotalTiempo")
+    assert len(hist) == 2 and hist["Conteo"].sum() == 2
+
+
+def test_empty_histogram():
+    hist = VisitSketches().update(_visits([np.nan])).histogram("TotalTiempo")
+    assert hist.empty
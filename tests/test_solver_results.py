@@ -0,0 +1,18 @@
+from SolverResults import SolverResults
+
+
+def test_expired_result_is_dropped_and_key_can_be_claimed(tmp_path):
+    results = SolverResults(str(tmp_path))
+    key = ("tabla", "v1", ("t_capacity", 3))
+    assert results.claim(key)
+    results.put(key, {"error": "falló"}, ttl=-1)
+    assert results.get(key) is None
+    assert results.claim(key)
+
+
+def test_result_without_ttl_is_kept(tmp_path):
+    results = SolverResults(str(tmp_path))
+    key = ("tabla", "v1")
+    assert results.claim(key)
+    results.put(key, {"summary": {"cost": 1.0}})
+    assert results.get(key) == {"summary": {"cost": 1.0}}
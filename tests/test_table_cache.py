@@ -0,0 +1,30 @@
+import pandas as pd
+
+from TableCache import TableCache
+
+
+def test_get_versioned_returns_version_of_that_frame():
+    loads = []
+
+    def load(name):
+        loads.append(name)
+        return pd.DataFrame({"x": range(10)})
+
+    cache = TableCache(load, budget_bytes=10**6)
+    df, v1 = cache.get_versioned("a")
+    again, same = cache.get_versioned("a")
+    assert again is df and same == v1 and loads == ["a"]
+
+    v2 = cache.put("a", pd.DataFrame({"x": range(5)}))
+    assert v2 != v1
+    df2, v = cache.get_versioned("a")
+    assert len(df2) == 5 and v == v2
+
+
+def test_reload_after_eviction_gets_new_version():
+    cache = TableCache(lambda name: pd.DataFrame({"x": range(1000)}), budget_bytes=10_000)
+    _, va = cache.get_versioned("a")
+    cache.get_versioned("b")          # desaloja "a" por presupuesto
+    assert "a" not in cache
+    _, va2 = cache.get_versioned("a")
+    assert va2 != va
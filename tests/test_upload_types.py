@@ -0,0 +1,41 @@
+import datetime as dt
+
+import pandas as pd
+
+import upload_to_sql
+from Backends import SQLiteBackend, restore_temporal
+
+
+def test_midnight_dates_stay_datetime2():
+    df = pd.DataFrame({"Fecha": pd.to_datetime(["2024-01-02", "2024-01-03"])})
+    assert upload_to_sql.inferir_tipos(df)["Fecha"] == "DATETIME2"
+
+
+def test_restore_temporal_converts_pyodbc_objects():
+    # Así devuelve pyodbc las columnas DATE y TIME
+    df = pd.DataFrame({
+        "Fecha": [dt.date(2024, 1, 2), None],
+        "Hora": [dt.time(8, 15, 30), None],
+        "Sucursal": ["A", "B"],
+    })
+    out = restore_temporal(df)
+    assert out["Fecha"].dtype == "datetime64[ns]"
+    assert out["Fecha"].iloc[0] == pd.Timestamp("2024-01-02") and pd.isna(out["Fecha"].iloc[1])
+    assert pd.api.types.is_timedelta64_dtype(out["Hora"])
+    assert out["Hora"].iloc[0] == pd.Timedelta(hours=8, minutes=15, seconds=30)
+    assert out["Sucursal"].tolist() == ["A", "B"]
+
+
+def test_local_round_trip_keeps_datetime64(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "t.db"))
+    df = pd.DataFrame({
+        "Fecha": pd.to_datetime(["2024-01-02", "2024-01-03"]),
+        "Hora inicio de atencion": pd.to_datetime(["2024-01-02 08:00", "2024-01-03 09:30"]),
+        "Sucursal": ["A", "B"],
+    })
+    backend.write_table("Visitas", df)
+    out = backend.read_sql('SELECT * FROM "Visitas"', table="Visitas")
+    assert pd.api.types.is_datetime64_dtype(out["Fecha"])
+    pd.testing.assert_series_equal(out["Fecha"], df["Fecha"], check_dtype=False)
+    pd.testing.assert_series_equal(out["Hora inicio de atencion"], df["Hora inicio de atencion"],
+                                   check_dtype=False)
@@ -2,9 +2,13 @@
 # eliminar_todas_menos_dos.py
 
 import logging
-from sqlalchemy import create_engine, text
-import urllib
-from SecretKeys import SecretKeys  # Asegúrate de tener este módulo disponible
+import os
+import sys
+
+# Permite ejecutar el script desde la raíz del repositorio (python utils/...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backends import make_backend, versions_of
 
 # Configura logs
 logging.basicConfig(
@@ -12,25 +16,8 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 
-# Obtiene credenciales desde Azure Key Vault
-secrets = SecretKeys()
-server = secrets.get("SERVER")
-database = secrets.get("DATABASE")
-user = secrets.get("USER")
-password = secrets.get("PASSWORD")
-driver = secrets.get("DRIVER") or "{ODBC Driver 17 for SQL Server}"
-
-# Crea la cadena de conexión
-odbc_str = (
-    f"DRIVER={driver};"
-    f"SERVER={server},1433;"
-    f"DATABASE={database};"
-    f"UID={user};PWD={password};"
-    "Encrypt=yes;TrustServerCertificate=no;"
-    "Connection Timeout=30;"
-)
-
-engine = create_engine(f"mssql+pyodbc:///?odbc_connect={urllib.parse.quote_plus(odbc_str)}")
+# Backend configurado (SQL Server vía Key Vault, o base local con DATA_BACKEND)
+backend = make_backend()
 
 # Tablas que quieres conservar
 tablas_a_conservar = [
@@ -38,14 +25,32 @@ tablas_a_conservar = [
     "Datos_20Minutos_a_4Horas_con_sentido"
 ]
 
-# Elimina todas las tablas excepto las que están en la lista de conservación
-with engine.begin() as conn:
-    sql = f"""
-    DECLARE @sql NVARCHAR(MAX) = N'';
-    SELECT @sql += 'DROP TABLE ' + QUOTENAME(SCHEMA_NAME(schema_id)) + '.' + QUOTENAME(name) + ';'
-    FROM sys.tables
-    WHERE name NOT IN ({','.join(f"'{tbl}'" for tbl in tablas_a_conservar)});
-    EXEC sp_executesql @sql;
-    """
-    conn.execute(text(sql))
-    logging.info("✅ Se eliminaron todas las tablas excepto las especificadas.")
+# Elimina todas las tablas excepto las que están en la lista de conservación,
+# junto con sus versiones publicadas (<tabla>_limpia_AAAAMMDD_HHMMSS_ffffff)
+existentes = backend.list_tables()
+conservar = set(tablas_a_conservar)
+for tbl in tablas_a_conservar:
+    conservar.update(versions_of(tbl, existentes))
+
+if backend.name == "sqlserver":
+    from sqlalchemy import text
+
+    lista = ",".join("N'" + tbl.replace("'", "''") + "'" for tbl in conservar)
+    with backend.engine.begin() as conn:
+        # Primero los sinónimos (nombres publicados) y luego las tablas
+        sql = f"""
+        DECLARE @sql NVARCHAR(MAX) = N'';
+        SELECT @sql += 'DROP SYNONYM ' + QUOTENAME(SCHEMA_NAME(schema_id)) + '.' + QUOTENAME(name) + ';'
+        FROM sys.synonyms
+        WHERE name NOT IN ({lista});
+        SELECT @sql += 'DROP TABLE ' + QUOTENAME(SCHEMA_NAME(schema_id)) + '.' + QUOTENAME(name) + ';'
+        FROM sys.tables
+        WHERE name NOT IN ({lista});
+        EXEC sp_executesql @sql;
+        """
+        conn.execute(text(sql))
+else:
+    for tbl in existentes:
+        if tbl not in conservar:
+            backend.drop_table(tbl)
+logging.info("✅ Se eliminaron todas las tablas excepto las especificadas.")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# refresh_dataset.py — Recarga una tabla desde la base de datos y publica una
+# nueva versión del dataset compartido; los workers de gunicorn la adjuntan en
+# su siguiente request sin reiniciar.
+#
+# Uso:
+#   python utils/refresh_dataset.py [--tabla NOMBRE]
+
+import argparse
+import logging
+import os
+import sys
+
+# Permite ejecutar el script desde la raíz del repositorio (python utils/...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Analisis import preprocess_visits
+from DataLoader import DataLoader
+from SharedDataset import SharedDataset
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publica una nueva versión del dataset compartido.")
+    parser.add_argument("--tabla", default=None, help="tabla a publicar (default: la primera)")
+    args = parser.parse_args()
+
+    loader = DataLoader()
+    tabla = args.tabla or loader.list_tables()[0]
+    # Versión publicada de la tabla (con publicación versionada, la tabla _limpia_ vigente)
+    origen = loader.table_version(tabla)
+    df = preprocess_visits(loader.load_table(origen).copy())
+    version = SharedDataset(tabla).publish(df, source=origen)
+    logging.info("✅ '%s' publicada como versión %s", tabla, version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# synthetic_data.py — Genera visitas sintéticas con las mismas columnas que las
+# tablas reales (ya tipadas como quedan tras upload_to_sql) y las escribe en un
+# backend local para pruebas de carga y perfilado sin acceso a Azure.
+#
+# Uso:
+#   DATA_BACKEND=sqlite python utils/synthetic_data.py --filas 10000000 --sucursales 50
+
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import sys
+
+# Permite ejecutar el script desde la raíz del repositorio (python utils/...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backends import make_backend
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+
+# ===== CONFIGURACIÓN =====
+SERVICIOS = [
+    "DENSITOMETRIA", "ULTRASONIDO", "TOMOGRAFIA", "MASTOGRAFIA", "NUTRICION",
+    "OPTOMETRIA", "RESONANCIA MAGNETICA", "LABORATORIO", "RAYOS X", "PAPANICOLAOU",
+]
+# Minutos de atención típicos (mediana) por servicio
+ATENCION_MEDIANA = np.array([7.0, 15.0, 19.0, 8.0, 12.0, 10.0, 36.0, 4.0, 6.0, 9.0])
+# Peso relativo de llegadas por hora del día (06:00–19:00)
+HORAS = np.arange(6, 20)
+PERFIL_HORARIO = np.array([3, 9, 12, 11, 9, 8, 7, 6, 6, 6, 5, 4, 3, 2], dtype=float)
+# Peso relativo por día de la semana (lunes=0 … domingo=6)
+PERFIL_SEMANAL = np.array([1.15, 1.05, 1.0, 1.0, 1.05, 0.9, 0.45])
+CHUNK_FILAS = 1_000_000
+
+
+def nombres_sucursales(n: int) -> list:
+    return [f"SUCURSAL {i:03d}" for i in range(1, n + 1)]
+
+
+def generar_visitas(
+    n_filas: int,
+    n_sucursales: int = 20,
+    dias: int = 90,
+    fecha_inicio: str = "2025-01-01",
+    semilla: int = 42,
+) -> pd.DataFrame:
+    """
+    Genera `n_filas` visitas sintéticas repartidas en `n_sucursales` y `dias` días.
+    Las columnas y tipos coinciden con las tablas *_con_sentido ya cargadas.
+    """
+    rng = np.random.default_rng(semilla)
+    sucursales = np.array(nombres_sucursales(n_sucursales), dtype=object)
+
+    # Cada sucursal tiene su propio volumen y nivel de espera (estables entre chunks)
+    rng_suc = np.random.default_rng(n_sucursales)
+    peso_suc = rng_suc.gamma(2.0, 1.0, n_sucursales)
+    espera_media = rng_suc.uniform(2.0, 15.0, n_sucursales)
+
+    dias_idx = np.arange(dias)
+    inicio = pd.Timestamp(fecha_inicio)
+    dia_semana = (inicio.dayofweek + dias_idx) % 7
+    peso_dia = PERFIL_SEMANAL[dia_semana]
+
+    suc = rng.choice(n_sucursales, n_filas, p=peso_suc / peso_suc.sum())
+    dia = rng.choice(dias, n_filas, p=peso_dia / peso_dia.sum())
+    hora = rng.choice(HORAS, n_filas, p=PERFIL_HORARIO / PERFIL_HORARIO.sum())
+    serv = rng.integers(0, len(SERVICIOS), n_filas)
+
+    espera = np.round(rng.exponential(espera_media[suc]), 2)
+    atencion = np.round(rng.lognormal(np.log(ATENCION_MEDIANA[serv]), 0.4), 2)
+
+    fecha = inicio + pd.to_timedelta(dia, unit="D")
+    ini_espera = fecha + pd.to_timedelta(hora * 3600 + rng.integers(0, 3600, n_filas), unit="s")
+    fin_espera = ini_espera + pd.to_timedelta(espera, unit="m")
+    fin_atencion = fin_espera + pd.to_timedelta(atencion, unit="m")
+    nacimiento = pd.Timestamp("1940-01-01") + pd.to_timedelta(
+        rng.integers(0, 365 * 80, n_filas), unit="D"
+    )
+
+    return pd.DataFrame({
+        "Sucursal": sucursales[suc],
+        "Servicio realizado": np.array(SERVICIOS, dtype=object)[serv],
+        "Clave servicio realizado": rng.integers(10**8, 10**9, n_filas),
+        "Fecha": fecha,
+        "Hora inicio de espera": ini_espera,
+        "Hora fin de espera": fin_espera,
+        "Minutos de espera": espera,
+        "Fecha tiempo de atencion": fecha,
+        "Hora inicio de atencion": fin_espera,
+        "Hora fin de atencion": fin_atencion,
+        "Minutos de atencion": atencion,
+        "Cumple_20min": espera <= 20,
+        "Hora inicio de espera limpia": ini_espera,
+        "Hora fin de espera limpia": fin_espera,
+        "PacienteFechaNacimiento": nacimiento,
+    })
+
+
+def escribir_visitas(backend, tabla: str, n_filas: int, n_sucursales: int = 20,
+                     dias: int = 90, semilla: int = 42, chunk: int = CHUNK_FILAS) -> int:
+    """Genera y escribe las visitas por bloques para no agotar la memoria."""
+    escritas = 0
+    k = 0
+    while escritas < n_filas:
+        n = min(chunk, n_filas - escritas)
+        df = generar_visitas(n, n_sucursales, dias, semilla=semilla + k)
+        backend.write_table(tabla, df, if_exists="replace" if k == 0 else "append")
+        escritas += n
+        k += 1
+        logging.info("   %s / %s filas escritas en '%s'", escritas, n_filas, tabla)
+    backend.create_indexes(tabla, ["Fecha", "Sucursal"])
+    return escritas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera visitas sintéticas en una base local.")
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--sucursales", type=int, default=20)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--tabla", default="Datos_Sinteticos_con_sentido")
+    parser.add_argument("--backend", default=None, help="sqlite o duckdb (default: DATA_BACKEND o sqlite)")
+    parser.add_argument("--ruta", default=None, help="archivo local (default: DATA_LOCAL_PATH)")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    backend = make_backend(args.backend or os.getenv("DATA_BACKEND", "sqlite"), local_path=args.ruta)
+    if backend.name == "sqlserver":
+        parser.error("Los datos sintéticos solo se escriben en backends locales (sqlite/duckdb).")
+    escribir_visitas(backend, args.tabla, args.filas, args.sucursales, args.dias, args.semilla)
+    logging.info("✅ Datos sintéticos listos en %s", backend.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
-# upload_to_sql.py — Elimina todas las tablas y sube nuevos archivos,
-# filtrando las columnas de fecha y hora a partir del año 2000
+# upload_to_sql.py — Publica cada archivo como una versión nueva de su tabla,
+# filtrando las columnas de fecha y hora a partir del año 2000. La versión se
+# carga e indexa aparte y luego reemplaza a la anterior de forma atómica, así
+# que los lectores nunca ven la tabla vacía o a medio cargar.
 
 import os
+import sys
 import glob
+import datetime as dt
 import pandas as pd
-import urllib
-import pyodbc
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.exc import SQLAlchemyError
-from SecretKeys import SecretKeys
+
+# Permite ejecutar el script desde la raíz del repositorio (python utils/...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backends import make_backend, version_name, versions_of
 
 # ===== CONFIGURACIÓN =====
 MIN_FECHA = pd.Timestamp("2000-01-01")
@@ -26,29 +30,27 @@ COLUMNS_TO_FILTER = [
     "Hora inicio de espera limpia",
     "Hora fin de espera limpia"
 ]
+# Tipado de columnas de texto
+NVARCHAR_MAX_LEN = 4000
+PATRON_FECHA = r"\d{4}-\d{2}-\d{2}"
+PATRON_HORA = r"\d{2}:\d{2}(:\d{2}(\.\d+)?)?"
+# Índices tras la carga: "columnstore", "fecha_sucursal" o "ninguno"
+INDICE_MODO = os.getenv("INDICE_MODO", "columnstore")
+COLUMNAS_INDICE = ["Fecha", "Sucursal"]
+# Versiones de cada tabla que se conservan (incluida la vigente)
+CONSERVAR_VERSIONES = int(os.getenv("CONSERVAR_VERSIONES", "3"))
+
+# ===== BACKEND =====
+# DATA_BACKEND=sqlite|duckdb carga a un archivo local en lugar de SQL Server
+_backend = None
+
 
-# ===== SECRETOS Y CONEXIÓN =====
-sk = SecretKeys()
-server   = sk.get("SERVER")
-database = sk.get("DATABASE")
-user     = sk.get("USER")
-password = sk.get("PASSWORD")
-driver   = sk.get("DRIVER") or "{ODBC Driver 17 for SQL Server}"
-
-# Cadena ODBC (para pyodbc) y URL SQLAlchemy (para DDL)
-odbc_str = (
-    f"DRIVER={driver};"
-    f"SERVER={server},1433;"
-    f"DATABASE={database};"
-    f"UID={user};PWD={password};"
-    "Encrypt=yes;TrustServerCertificate=no;"
-)
-engine = create_engine(
-    f"mssql+pyodbc:///?odbc_connect={urllib.parse.quote_plus(odbc_str)}",
-    fast_executemany=True,
-    pool_pre_ping=True
-)
-inspector = inspect(engine)
+def get_backend():
+    """Crea el backend de destino en el primer uso (no conecta al importar)."""
+    global _backend
+    if _backend is None:
+        _backend = make_backend()
+    return _backend
 
 # ===== FUNCIONES AUXILIARES =====
 def encontrar_archivos(directorio: str) -> list:
@@ -80,37 +82,223 @@ def parse_datetime_series(serie: pd.Series) -> pd.Series:
     return out
 
 
-def delete_all_tables():
-    """Elimina todas las tablas existentes en la base de datos."""
-    print("⚠️ Eliminando todas las tablas existentes...")
-    try:
-        with engine.connect() as conn:
-            for tbl in inspector.get_table_names():
-                print(f"   🗑️ Eliminando {tbl}")
-                conn.execute(text(f"DROP TABLE [{tbl}];"))
-    except SQLAlchemyError as e:
-        print(f"❌ Error eliminando tablas: {e}")
-        exit(1)
-    print("✅ Todas las tablas fueron eliminadas.")
-
-
-def crear_tabla(cursor, nombre: str, df: pd.DataFrame):
-    """Crea la tabla en SQL Server con columnas basadas en los dtypes del DataFrame."""
-    cols_sql = []
+def _tipo_texto(serie: pd.Series) -> str:
+    """Infiere DATE/TIME/NVARCHAR(n) para una columna de texto u objetos."""
+    valores = serie.dropna()
+    if valores.empty:
+        return "NVARCHAR(255)"
+    primero = valores.iloc[0]
+    if isinstance(primero, dt.time) and valores.map(lambda v: isinstance(v, dt.time)).all():
+        return "TIME"
+    if (isinstance(primero, dt.date) and not isinstance(primero, dt.datetime)
+            and valores.map(lambda v: type(v) is dt.date).all()):
+        return "DATE"
+
+    texto = valores.astype(str)
+    if texto.str.fullmatch(PATRON_HORA).all():
+        return "TIME"
+    if texto.str.fullmatch(PATRON_FECHA).all():
+        return "DATE"
+
+    largo = int(texto.str.len().max())
+    if largo > NVARCHAR_MAX_LEN:
+        return "NVARCHAR(MAX)"
+    # Redondea a la siguiente potencia de 2 para dejar holgura a cargas futuras
+    n = 16
+    while n < largo:
+        n *= 2
+    return f"NVARCHAR({min(n, NVARCHAR_MAX_LEN)})"
+
+
+def inferir_tipos(df: pd.DataFrame) -> dict:
+    """Devuelve {columna: tipo SQL} a partir de los dtypes y valores del DataFrame."""
+    tipos = {}
     for col, dtype in df.dtypes.items():
-        if pd.api.types.is_integer_dtype(dtype):
+        if pd.api.types.is_bool_dtype(dtype):
+            t = "BIT"
+        elif pd.api.types.is_integer_dtype(dtype):
             t = "BIGINT"
         elif pd.api.types.is_float_dtype(dtype):
             t = "FLOAT"
-        elif pd.api.types.is_bool_dtype(dtype):
-            t = "BIT"
         elif pd.api.types.is_datetime64_any_dtype(dtype):
+            # Siempre DATETIME2, aunque solo haya medianoches: DATE vuelve como objetos
+            # datetime.date (más memoria y sin columnas datetime64 compartibles)
             t = "DATETIME2"
         else:
-            t = "NVARCHAR(MAX)"
-        cols_sql.append(f"[{col}] {t}")
+            t = _tipo_texto(df[col])
+        tipos[col] = t
+    return tipos
+
+
+def crear_tabla(cursor, nombre: str, df: pd.DataFrame) -> dict:
+    """Crea la tabla en SQL Server con tipos inferidos de los datos y devuelve el mapa de tipos."""
+    tipos = inferir_tipos(df)
+    cols_sql = [f"[{col}] {t}" for col, t in tipos.items()]
     ddl = f"CREATE TABLE [{nombre}] ({', '.join(cols_sql)});"
     cursor.execute(ddl)
+    return tipos
+
+
+def crear_indices(cursor, nombre: str, tipos: dict, modo: str = INDICE_MODO):
+    """
+    Crea índices analíticos tras la carga.
+    - "columnstore": índice columnar agrupado (agregaciones y filtros por columna)
+    - "fecha_sucursal": índices no agrupados sobre Fecha y Sucursal
+    - "ninguno": deja la tabla como heap
+    Devuelve True si se creó al menos un índice.
+    """
+    creados = 0
+    if modo == "columnstore":
+        cursor.execute(f"CREATE CLUSTERED COLUMNSTORE INDEX [CCI_{nombre}] ON [{nombre}];")
+        creados += 1
+    elif modo == "fecha_sucursal":
+        for col in COLUMNAS_INDICE:
+            # Las columnas MAX no pueden ser clave de un índice de filas
+            if col in tipos and tipos[col] != "NVARCHAR(MAX)":
+                ix = f"IX_{nombre}_{col.replace(' ', '_')}"
+                cursor.execute(f"CREATE NONCLUSTERED INDEX [{ix}] ON [{nombre}] ([{col}]);")
+                creados += 1
+    elif modo != "ninguno":
+        print(f"   ⚠️ Modo de índice desconocido '{modo}', omitiendo índices.")
+    return creados > 0
+
+def leer_archivo(ruta: str) -> pd.DataFrame:
+    """Lee un CSV/XLS/XLSX y filtra las columnas de fecha/hora anteriores a MIN_FECHA."""
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext == ".csv":
+        df = pd.read_csv(ruta)
+    else:
+        df = pd.read_excel(ruta, engine="openpyxl")
+
+    # Aplicar filtro en las columnas de fecha/hora definidas
+    for col in COLUMNS_TO_FILTER:
+        if col in df.columns:
+            df[col] = parse_datetime_series(df[col])
+            antes = len(df)
+            df = df[df[col] >= MIN_FECHA]
+            filt = antes - len(df)
+            print(f"   🧹 Filtradas {filt} filas con '{col}' < {MIN_FECHA.date()}")
+    return df
+
+
+def subir_sqlserver(backend, tabla: str, df: pd.DataFrame) -> int:
+    """Crea la tabla tipada en SQL Server, inserta con fast_executemany y crea índices."""
+    # Conexión pyodbc para DDL y DML
+    conn_py = backend.connect()
+    cursor = conn_py.cursor()
+    try:
+        cursor.fast_executemany = True
+    except:
+        pass
+
+    # Crear tabla en BD
+    try:
+        tipos = crear_tabla(cursor, tabla, df)
+    except Exception as e:
+        print(f"   ❌ Error creando tabla '{tabla}': {e}")
+        cursor.close(); conn_py.close()
+        return 0
+
+    # Insertar datos
+    cols         = [f"[{c}]" for c in df.columns]
+    placeholders = ",".join("?" for _ in df.columns)
+    sql_ins      = f"INSERT INTO [{tabla}] ({','.join(cols)}) VALUES ({placeholders})"
+    data         = [tuple(None if pd.isna(v) else v for v in row) for row in df.itertuples(index=False)]
+
+    insertadas = 0
+    if not data:
+        print(f"   ⚠️ No hay filas para insertar en '{tabla}', omitiendo.")
+    else:
+        try:
+            cursor.executemany(sql_ins, data)
+            conn_py.commit()
+            insertadas = len(data)
+            print(f"   ✅ Insertadas {len(data)} filas en '{tabla}'")
+        except Exception as e:
+            print(f"   ❌ Error insertando en '{tabla}': {e}")
+            conn_py.rollback()
+
+    # Índices después de insertar (más rápido que mantenerlos durante la carga);
+    # si la inserción falló no hay datos que indexar
+    if insertadas:
+        try:
+            if crear_indices(cursor, tabla, tipos):
+                print(f"   📇 Índices '{INDICE_MODO}' creados en '{tabla}'")
+            conn_py.commit()
+        except Exception as e:
+            print(f"   ⚠️ No se pudieron crear índices en '{tabla}': {e}")
+            conn_py.rollback()
+
+    cursor.close()
+    conn_py.close()
+    return insertadas
+
+
+def subir_local(backend, tabla: str, df: pd.DataFrame) -> int:
+    """Escribe la tabla en la base local (SQLite/DuckDB) e indexa Fecha/Sucursal."""
+    try:
+        insertadas = backend.write_table(tabla, df)
+    except Exception as e:
+        print(f"   ❌ Error insertando en '{tabla}': {e}")
+        return 0
+    print(f"   ✅ Insertadas {insertadas} filas en '{tabla}'")
+    if INDICE_MODO != "ninguno":
+        backend.create_indexes(tabla, [c for c in COLUMNAS_INDICE if c in df.columns])
+    return insertadas
+
+
+def subir_tabla(tabla: str, df: pd.DataFrame) -> int:
+    """Sube el DataFrame al backend configurado y devuelve las filas insertadas."""
+    backend = get_backend()
+    if backend.name == "sqlserver":
+        return subir_sqlserver(backend, tabla, df)
+    return subir_local(backend, tabla, df)
+
+
+def aplicar_retencion(tabla: str, conservar: int = CONSERVAR_VERSIONES) -> list:
+    """Elimina las versiones más antiguas de `tabla` y devuelve las eliminadas."""
+    backend = get_backend()
+    vigente = backend.current_version(tabla)
+    versiones = versions_of(tabla, backend.list_tables())
+    eliminadas = [v for v in versiones[:-max(conservar, 1)] if v != vigente]
+    for v in eliminadas:
+        try:
+            backend.drop_table(v)
+            print(f"   🗑️ Versión antigua eliminada: '{v}'")
+        except Exception as e:
+            # Puede seguir en uso por una lectura larga; se reintenta en la próxima carga
+            print(f"   ⚠️ No se pudo eliminar '{v}': {e}")
+    return eliminadas
+
+
+def publicar_tabla(tabla: str, df: pd.DataFrame, conservar: int = CONSERVAR_VERSIONES) -> int:
+    """
+    Carga `df` en una versión nueva `<tabla>_limpia_AAAAMMDD_HHMMSS_ffffff` (con índices),
+    la activa de forma atómica bajo el nombre `tabla` y aplica la retención.
+    Si la carga falla, la versión vigente no cambia.
+    """
+    backend = get_backend()
+    existentes = set(backend.list_tables())
+    # Nunca se carga sobre un nombre existente (p. ej. X.csv y X.xlsx en el mismo instante)
+    version = version_name(tabla)
+    while version in existentes:
+        version = version_name(tabla)
+    insertadas = subir_tabla(version, df)
+    if insertadas == 0:
+        print(f"   ❌ La versión '{version}' quedó vacía; '{tabla}' conserva su versión actual.")
+        # Solo se borra lo que creó esta carga, nunca la versión vigente
+        if version not in existentes and version != backend.current_version(tabla):
+            try:
+                backend.drop_table(version)
+            except Exception:
+                pass
+        return 0
+
+    backend.swap_version(tabla, version)
+    print(f"   🔀 '{tabla}' ahora apunta a '{version}'")
+    aplicar_retencion(tabla, conservar)
+    return insertadas
+
 
 # ===== PROCESO PRINCIPAL =====
 def main():
@@ -119,66 +307,15 @@ def main():
         print(f"❌ No se encontraron archivos en {DATA_DIR}")
         return
 
-    delete_all_tables()
-
     for ruta in archivos:
         nombre = os.path.basename(ruta)
         tabla  = os.path.splitext(nombre)[0].replace(" ", "_")
         print(f"\n➡️ Procesando '{nombre}' → tabla '{tabla}'")
 
-        # Cargar el DataFrame
-        ext = os.path.splitext(ruta)[1].lower()
-        if ext == ".csv":
-            df = pd.read_csv(ruta)
-        else:
-            df = pd.read_excel(ruta, engine="openpyxl")
-
-        # Aplicar filtro en las columnas de fecha/hora definidas
-        for col in COLUMNS_TO_FILTER:
-            if col in df.columns:
-                df[col] = parse_datetime_series(df[col])
-                antes = len(df)
-                df = df[df[col] >= MIN_FECHA]
-                filt = antes - len(df)
-                print(f"   🧹 Filtradas {filt} filas con '{col}' < {MIN_FECHA.date()}")
-
-        # Conexión pyodbc para DDL y DML
-        conn_py = pyodbc.connect(odbc_str)
-        cursor = conn_py.cursor()
-        try:
-            cursor.fast_executemany = True
-        except:
-            pass
-
-        # Crear tabla en BD
-        try:
-            crear_tabla(cursor, tabla, df)
-        except Exception as e:
-            print(f"   ❌ Error creando tabla '{tabla}': {e}")
-            cursor.close(); conn_py.close()
-            continue
-
-        # Insertar datos
-        cols         = [f"[{c}]" for c in df.columns]
-        placeholders = ",".join("?" for _ in df.columns)
-        sql_ins      = f"INSERT INTO [{tabla}] ({','.join(cols)}) VALUES ({placeholders})"
-        data         = [tuple(None if pd.isna(v) else v for v in row) for row in df.itertuples(index=False)]
-
-        if not data:
-            print(f"   ⚠️ No hay filas para insertar en '{tabla}', omitiendo.")
-        else:
-            try:
-                cursor.executemany(sql_ins, data)
-                conn_py.commit()
-                print(f"   ✅ Insertadas {len(data)} filas en '{tabla}'")
-            except Exception as e:
-                print(f"   ❌ Error insertando en '{tabla}': {e}")
-                conn_py.rollback()
-
-        cursor.close()
-        conn_py.close()
+        df = leer_archivo(ruta)
+        publicar_tabla(tabla, df)
 
     print("\n🎉 ¡Carga finalizada!")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()